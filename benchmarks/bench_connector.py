@@ -0,0 +1,104 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+"""
+连接器的基准测试：在测试库中创建临时表，分别用 C 扩展和纯 Python 实现、元组游标和缓存结果的字典游标
+执行相同的 INSERT/UPDATE/DELETE，输出每条语句的平均耗时和客户端 CPU 耗时（process_time，不包括等待服务端的时间）。
+没有 C 扩展时跳过 C 扩展，测试结束后删除临时表。
+用法：python benchmarks/bench_connector.py -H 127.0.0.1 -P 3306 -u root -p xxx -d test --statements 20000
+"""
+import sys
+import time
+import argparse
+from getpass import getpass
+
+import mysql.connector as cpy
+
+TABLE = '_bench_connector'
+CREATE_TABLE_SQL = f"""CREATE TABLE IF NOT EXISTS `{TABLE}` (
+    `id` bigint unsigned NOT NULL,
+    `user_id` int NOT NULL,
+    `amount` decimal(12, 2) NOT NULL,
+    `note` varchar(64) NOT NULL,
+    PRIMARY KEY (`id`)
+) ENGINE=InnoDB"""
+CURSOR_KWARGS = {
+    'tuple': {},
+    'dict buffered': {'dictionary': True, 'buffered': True},
+}
+
+
+def generate_sql_list(statements):
+    sql_list = []
+    for i in range(statements):
+        sql_type = i % 3
+        if sql_type == 0:
+            sql_list.append(f"INSERT INTO `{TABLE}` (`id`, `user_id`, `amount`, `note`) "
+                            f"VALUES ({i}, {i % 1000}, {i}.50, 'order {i}')")
+        elif sql_type == 1:
+            sql_list.append(f"UPDATE `{TABLE}` SET `amount` = {i}.00, `note` = 'update {i}' WHERE `id` = {i - 1}")
+        else:
+            sql_list.append(f"DELETE FROM `{TABLE}` WHERE `id` = {i - 2}")
+    return sql_list
+
+
+def bench(conn_setting, use_pure, cursor_kwargs, sql_list, chunk):
+    """返回 (总耗时, 客户端 CPU 耗时)"""
+    connection = cpy.connect(use_pure=use_pure, **conn_setting)
+    try:
+        cursor = connection.cursor(**cursor_kwargs)
+        cursor.execute(f'TRUNCATE TABLE `{TABLE}`')
+        ts_start = time.perf_counter()
+        cpu_start = time.process_time()
+        for i in range(0, len(sql_list), chunk):
+            for sql in sql_list[i:i + chunk]:
+                cursor.execute(sql)
+            cursor.execute('commit')
+        return time.perf_counter() - ts_start, time.process_time() - cpu_start
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of C extension and pure python mysql connector.')
+    parser.add_argument('-H', '--host', type=str, default='127.0.0.1')
+    parser.add_argument('-P', '--port', type=int, default=3306)
+    parser.add_argument('-u', '--user', type=str, default='root')
+    parser.add_argument('-p', '--password', type=str, default=None, help='Prompt for password if not given.')
+    parser.add_argument('-d', '--database', type=str, required=True, help='Database to create the test table in.')
+    parser.add_argument('--statements', type=int, default=20000, help='Statements executed of every case.')
+    parser.add_argument('--chunk', type=int, default=2000)
+    bench_args = parser.parse_args()
+
+    conn_setting = {
+        'host': bench_args.host, 'port': bench_args.port, 'user': bench_args.user, 'database': bench_args.database,
+        'password': bench_args.password if bench_args.password is not None else getpass('Password: '),
+        'autocommit': False,
+    }
+    connectors = [('pure', True)]
+    if cpy.HAVE_CEXT:
+        connectors.insert(0, ('cext', False))
+    else:
+        print('C extension of mysql-connector-python is not available, skip cext.')
+
+    sql_list = generate_sql_list(bench_args.statements)
+    connection = cpy.connect(**conn_setting)
+    try:
+        connection.cursor().execute(CREATE_TABLE_SQL)
+        print(f'Statements: {len(sql_list)}, chunk: {bench_args.chunk}, server: {connection.get_server_info()}')
+        print(f'{"connector":>10} {"cursor":>14} {"seconds":>9} {"us/stmt":>9} {"cpu us/stmt":>12}')
+        for connector, use_pure in connectors:
+            for cursor_name, cursor_kwargs in CURSOR_KWARGS.items():
+                used, cpu_used = bench(conn_setting, use_pure, cursor_kwargs, sql_list, bench_args.chunk)
+                print(f'{connector:>10} {cursor_name:>14} {used:9.3f} {used / len(sql_list) * 1e6:9.1f} '
+                      f'{cpu_used / len(sql_list) * 1e6:12.1f}')
+    except cpy.Error as e:
+        print(f'Benchmark failed: {e}')
+        sys.exit(1)
+    finally:
+        connection.cursor().execute(f'DROP TABLE IF EXISTS `{TABLE}`')
+        connection.close()
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+"""
+解析阶段的基准测试：生成测试文件，分别用 file_handle（单进程）和 parallel_file_handle（不同进程数）
+读取并分类，输出耗时、每秒行数和相对单进程的加速比，同时校验两者输出的 SQL 和行号完全一致。
+用法：python benchmarks/bench_parse.py --lines 2000000 --workers 1,2,4,8
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+from utils.other_utils import logger  # noqa: E402
+from utils.file_utils import file_handle  # noqa: E402
+from utils.parallel_utils import parallel_file_handle  # noqa: E402
+from utils.log_utils import LineSummary  # noqa: E402
+
+LINE_TEMPLATES = [
+    "INSERT INTO `t_order` (`id`, `user_id`, `amount`, `note`) VALUES ({i}, {u}, {i}.50, 'order {i}');",
+    "UPDATE `t_order` SET `amount` = {i}.00, `note` = 'update {i}' WHERE `id` = {i};",
+    "DELETE FROM `t_order` WHERE `id` = {u};",
+    "",
+    "-- comment {i}",
+    "  REPLACE INTO `t_user` (`id`, `name`) VALUES ({u}, 'user {u}')  ",
+]
+
+
+def generate_file(filename, lines):
+    with open(filename, 'w', encoding='utf8') as f:
+        for i in range(lines):
+            f.write(LINE_TEMPLATES[i % len(LINE_TEMPLATES)].format(i=i, u=i % 1000) + '\n')
+    return
+
+
+def run_handle(sql_parts):
+    """返回 (SQL 数, 行号校验和, 最后一次输出的跳过行数)"""
+    statement_count = 0
+    idx_checksum = 0
+    ignored_count = 0
+    for sql_list, sql_idx_list in sql_parts:
+        if sql_list:
+            statement_count += len(sql_list)
+            idx_checksum += sum(sql_idx_list) + sum(len(sql) for sql in sql_list)
+        else:
+            ignored_count += len(sql_idx_list)
+    return statement_count, idx_checksum, ignored_count
+
+
+def bench(filename, args, workers):
+    line_summary = LineSummary('', interval=3600)
+    ts_start = time.perf_counter()
+    if workers == 0:
+        result = run_handle(file_handle(filename, '', [], [], [], args, line_summary))
+    else:
+        args.parse_workers = workers
+        with ProcessPoolExecutor(workers) as executor:
+            result = run_handle(parallel_file_handle(executor, filename, '', [], [], [], args, line_summary))
+    return time.perf_counter() - ts_start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of file_handle and parallel_file_handle.')
+    parser.add_argument('--lines', type=int, default=2000000, help='Lines of generated file.')
+    parser.add_argument('--workers', type=str, default=','.join(str(2 ** i) for i in range(4)),
+                        help='Comma separated process counts of parallel_file_handle.')
+    parser.add_argument('--block-size', type=int, default=8, help='Block size (MB) of parallel_file_handle.')
+    parser.add_argument('--chunk', type=int, default=2000)
+    parser.add_argument('--file', type=str, default='', help='Use this file instead of generated file.')
+    bench_args = parser.parse_args()
+
+    logger.remove()
+    args = argparse.Namespace(chunk=bench_args.chunk, parse_block_size=bench_args.block_size, parse_workers=0,
+                              reset=True, stop_never=False)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = bench_args.file or os.path.join(tmp_dir, 'bench.sql')
+        if not bench_args.file:
+            generate_file(filename, bench_args.lines)
+        file_size = os.path.getsize(filename) / 1024 / 1024
+        print(f'File: {filename} ({file_size:.1f} MB), CPU count: {os.cpu_count()}')
+
+        base_used, base_result = bench(filename, args, 0)
+        total_lines = base_result[0] + base_result[2]
+        print(f'{"workers":>8} {"seconds":>9} {"lines/s":>12} {"speedup":>8}')
+        print(f'{"serial":>8} {base_used:9.3f} {total_lines / base_used:12.0f} {1:8.2f}')
+        for workers in [int(i) for i in bench_args.workers.split(',') if i.strip()]:
+            used, result = bench(filename, args, workers)
+            if result != base_result:
+                print(f'Result of {workers} workers is different from file_handle: {result} != {base_result}')
+                sys.exit(1)
+            print(f'{workers:>8} {used:9.3f} {total_lines / used:12.0f} {base_used / used:8.2f}')
+    return
+
+
+if __name__ == '__main__':
+    main()
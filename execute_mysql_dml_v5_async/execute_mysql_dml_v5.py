@@ -3,23 +3,29 @@
 import re
 import sys
 import asyncio
-import mysql.connector.aio as cpy_async
+from contextlib import aclosing
 from copy import deepcopy
 from pathlib import Path
 from utils.file_utils import modify_idx_record_list, sort_start, save_executed_result, \
-    get_file_executed_record, file_handle, get_sql_file_list
+    get_file_executed_record, iter_file_handle, get_sql_file_list
 from utils.parse_args_utils import parse_args_from_command_line
-from utils.other_utils import logger, get_log_format, ts_now, ts_interval
+from utils.rate_limit_utils import get_rate_limiter
+from utils.session_utils import get_session_variables, set_session_variables, restore_session_variables
+from utils.other_utils import logger, get_log_format, ts_now, ts_interval, add_log_file_sink, LoopLagMonitor
 
 
-async def execute_sql(connect, sql_list, sql_idx_list, args, base_format, info_format):
+async def execute_sql(connect, sql_list, sql_idx_list, args, base_format, info_format, rate_limiter=None,
+                      session_variables=None):
     is_finished = False
     affected_rows = 0
     sql_idx = 0
     sql = ''
+    original_variables = {}
     cursor = await connect.cursor()
 
     try:
+        if session_variables:
+            original_variables = await set_session_variables(cursor, session_variables)
         for sql, sql_idx in zip(sql_list, sql_idx_list):
             try:
                 await cursor.execute(sql)
@@ -36,6 +42,11 @@ async def execute_sql(connect, sql_list, sql_idx_list, args, base_format, info_f
             logger.info(info_format + f'[Committed line range: {committed_line_range}] '
                                       f'[Affected rows: {affected_rows}]')
             is_finished = True
+            if rate_limiter is not None:
+                # 所有协程共用一个令牌桶，提交之后再限速，等待期间不持有锁
+                await rate_limiter.async_consume(
+                    len(sql_list) if args.rate_limit_unit == 'statements' else affected_rows
+                )
     except Exception as e:
         await cursor.execute('rollback')
         logger.exception(base_format + str(e))
@@ -43,6 +54,11 @@ async def execute_sql(connect, sql_list, sql_idx_list, args, base_format, info_f
         logger.error(err_msg)
         sys.exit(1)
     finally:
+        if original_variables:
+            try:
+                await restore_session_variables(cursor, original_variables)
+            except Exception as e:
+                logger.warning(base_format + f'Restore session variables failed: {e}')
         await cursor.close()
         await connect.close()
 
@@ -61,7 +77,9 @@ async def execute_task(task, committed_part, unfinished_line_parts, args, sql_fi
     return True
 
 
-async def execute_sql_from_file(args, conn_setting, sql_file):
+async def execute_sql_from_file(args, conn_setting, sql_file, rate_limiter=None):
+    import mysql.connector.aio as cpy_async
+
     if not Path(sql_file).exists():
         logger.error(f'File {sql_file} does not exists.')
         return False
@@ -72,46 +90,58 @@ async def execute_sql_from_file(args, conn_setting, sql_file):
     tasks = []
     unfinished_line_parts = []
     executed_all_parts = False
+    session_variables = get_session_variables(args, sql_file)
 
     try:
-        for i, (sql_list, sql_idx_list) in enumerate(file_handle(sql_file, base_format, committed_part,
-                                                  deepcopy(committed_part_start),
-                                                  deepcopy(committed_part_end), args)):
-            if sql_list:
-                if args.file_per_thread:
-                    connect = await cpy_async.connect(**conn_setting)
-                    task = execute_sql(
-                        connect, sql_list, sql_idx_list, args, base_format, info_format
-                    )
-                    await execute_task(task, committed_part, unfinished_line_parts, args, sql_file)
-                    await connect.close()
-                    await asyncio.sleep(args.interval)
-                else:
-                    if i % args.threads == 0 and tasks != []:
-                        for task in asyncio.as_completed(tasks):
-                            await execute_task(task, committed_part, unfinished_line_parts, args, sql_file)
-
-                        del tasks
+        i = -1
+        # 解析文件在线程中进行，解析下一个 chunk 的同时事件循环继续执行已提交的数据库任务
+        # 提前退出（sys.exit、Ctrl-C）时 async for 不会关闭生成器，显式关闭才能让解析线程退出
+        async with aclosing(iter_file_handle(sql_file, base_format, committed_part, deepcopy(committed_part_start),
+                                             deepcopy(committed_part_end), args)) as sql_parts:
+            async for sql_list, sql_idx_list in sql_parts:
+                i += 1
+                if sql_list:
+                    if args.file_per_thread:
+                        connect = await cpy_async.connect(**conn_setting)
+                        task = execute_sql(
+                            connect, sql_list, sql_idx_list, args, base_format, info_format, rate_limiter,
+                            session_variables
+                        )
+                        await execute_task(task, committed_part, unfinished_line_parts, args, sql_file)
+                        await connect.close()
                         await asyncio.sleep(args.interval)
-                        tasks = []
-
-                    connect = await cpy_async.connect(**conn_setting)
-                    tasks.append(
-                        asyncio.create_task(
-                            execute_sql(connect, sql_list, sql_idx_list, args, base_format, info_format)
+                    else:
+                        if i % args.threads == 0 and tasks != []:
+                            for task in asyncio.as_completed(tasks):
+                                await execute_task(task, committed_part, unfinished_line_parts, args, sql_file)
+
+                            del tasks
+                            await asyncio.sleep(args.interval)
+                            tasks = []
+
+                        connect = await cpy_async.connect(**conn_setting)
+                        tasks.append(
+                            asyncio.create_task(
+                                execute_sql(connect, sql_list, sql_idx_list, args, base_format, info_format,
+                                            rate_limiter, session_variables)
+                            )
                         )
-                    )
-            else:
-                committed_part += sql_idx_list
-        else:
-            if unfinished_line_parts:
-                logger.error(info_format + f'Not all tasks finished, unfinished line parts: '
-                                           f'[{",".join(unfinished_line_parts)}]')
+                else:
+                    committed_part += sql_idx_list
             else:
-                executed_all_parts = True
-                logger.info(finished_info)
-                if args.delete_executed_file and int(ts_now() - Path(sql_file).stat().st_mtime) > 60:
-                    Path(sql_file).unlink()
+                # 最后一批任务也要等待完成后才能记录已提交的行
+                for task in asyncio.as_completed(tasks):
+                    await execute_task(task, committed_part, unfinished_line_parts, args, sql_file)
+                tasks = []
+
+                if unfinished_line_parts:
+                    logger.error(info_format + f'Not all tasks finished, unfinished line parts: '
+                                               f'[{",".join(unfinished_line_parts)}]')
+                else:
+                    executed_all_parts = True
+                    logger.info(finished_info)
+                    if args.delete_executed_file and int(ts_now() - Path(sql_file).stat().st_mtime) > 60:
+                        Path(sql_file).unlink()
     finally:
         committed_part.sort(key=sort_start)
         committed_part = modify_idx_record_list(committed_part)
@@ -130,15 +160,22 @@ async def main_work(args, execute_file_list: list = None):
     }
     if not get_sql_file_list:
         execute_file_list = get_sql_file_list(args)
+    rate_limiter = get_rate_limiter(args)
+    loop_lag_monitor = LoopLagMonitor(warning_threshold=args.loop_lag_warning / 1000)
+    monitor_task = asyncio.create_task(loop_lag_monitor.run())
 
-    while True:
-        for sql_file in execute_file_list:
-            await execute_sql_from_file(args, conn_setting, sql_file)
-
-        if not args.stop_never:
-            break
-        await asyncio.sleep(args.sleep)
-        execute_file_list = get_sql_file_list(args)
+    try:
+        while True:
+            for sql_file in execute_file_list:
+                await execute_sql_from_file(args, conn_setting, sql_file, rate_limiter)
+
+            if not args.stop_never:
+                break
+            await asyncio.sleep(args.sleep)
+            execute_file_list = await asyncio.to_thread(get_sql_file_list, args)
+    finally:
+        monitor_task.cancel()
+        loop_lag_monitor.report()
 
 
 def main(args, execute_file_list):
@@ -169,4 +206,5 @@ if __name__ == "__main__":
             sys.exit(1)
 
     assert command_line_args.database, "No database select."
+    add_log_file_sink()
     main(command_line_args, sql_file_list)
@@ -2,6 +2,8 @@
 # -*- coding:utf8 -*-
 import os
 import json
+import asyncio
+import threading
 from pathlib import Path
 from .other_utils import ts_now, logger
 
@@ -38,17 +40,34 @@ def get_sql_file_list(args):
     return file_list
 
 
-async def read_file(filename):
+def count_file_lines(filename):
+    """与 wc -l 结果一致（统计换行符个数），不需要启动子进程"""
+    line_count = 0
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            line_count += block.count(b'\n')
+    return line_count
+
+
+result_file_lock = threading.Lock()
+
+
+def load_json_file(filename):
     with Path(filename).open() as f:
         return json.loads(f.read())
 
 
-async def get_file_record_part_start_end(part):
+async def read_file(filename):
+    """在线程中读取和解析，不阻塞事件循环"""
+    return await asyncio.to_thread(load_json_file, filename)
+
+
+def get_file_record_part_start_end(part):
     start_part = []
     end_part = []
     for value in part:
         if '-' in value:
-            value_split = await value.split('-')
+            value_split = value.split('-')
             start_line = value_split[0]
             end_line = value_split[1]
         else:
@@ -60,29 +79,41 @@ async def get_file_record_part_start_end(part):
 
 async def get_file_executed_record(args, sql_file):
     executed_result = await read_file(args.result_file) if Path(args.result_file).exists() else {}
-    committed_part = executed_result.get(sql_file, [])
+    committed_part = executed_result.get(str(sql_file), [])
 
     if args.reset:
         committed_part = []
         committed_part_start = []
         committed_part_end = []
     else:
-        committed_part_start, committed_part_end = await get_file_record_part_start_end(committed_part)
+        committed_part_start, committed_part_end = get_file_record_part_start_end(committed_part)
     return committed_part, committed_part_start, committed_part_end
 
 
+def write_executed_result(result_file, sql_file, committed_part, delete_not_exists_file_record=False):
+    """多个线程同时保存时加锁读改写，写入临时文件后原子替换"""
+    with result_file_lock:
+        executed_result = load_json_file(result_file) if Path(result_file).exists() else {}
+        executed_result[str(sql_file)] = committed_part
+        if delete_not_exists_file_record:
+            for f in executed_result.copy().keys():
+                if not Path(f).exists():
+                    del executed_result[f]
+        msg = json.dumps(executed_result, ensure_ascii=False, indent=4) + '\n'
+        tmp_file = f'{result_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w', encoding='utf8') as f:
+            f.write(msg)
+        os.replace(tmp_file, result_file)
+    return
+
+
 async def save_executed_result(result_file, sql_file, committed_part, delete_not_exists_file_record=False,
                                executed_all_parts=False):
-    sql_file = str(sql_file)
-    executed_result = await read_file(result_file) if Path(result_file).exists() else {}
-    executed_result[sql_file] = committed_part
-    if delete_not_exists_file_record and executed_all_parts:
-        for f in executed_result.copy().keys():
-            if not Path(f).exists():
-                del executed_result[f]
-    msg = json.dumps(executed_result, ensure_ascii=False, indent=4) + '\n'
-    with open(result_file, 'w', encoding='utf8') as f:
-        f.write(msg)
+    """在线程中序列化和写入，不阻塞事件循环"""
+    await asyncio.to_thread(
+        write_executed_result, result_file, sql_file, committed_part,
+        delete_not_exists_file_record and executed_all_parts
+    )
     return
 
 
@@ -160,7 +191,7 @@ def file_handle(filename, base_format, committed_part, ignore_part_start, ignore
     ignore_line_idx_list = []   # 被跳过的行数列表
 
     if committed_part and not args.stop_never and not args.reset:
-        file_lines = "1-" + str(os.popen("wc -l " + filename + " | awk '{print $1}'").read().strip())
+        file_lines = "1-" + str(count_file_lines(filename))
         if committed_part[0] == file_lines:
             logger.warning(f'File {filename} had been executed all line parts, skip it.')
             return sql_list, sql_idx_list
@@ -191,3 +222,59 @@ def file_handle(filename, base_format, committed_part, ignore_part_start, ignore
                 sql_list = []
 
             yield sql_list, ignore_line_idx_list
+
+
+async def iter_file_handle(filename, base_format, committed_part, ignore_part_start, ignore_part_end, args,
+                           max_size=2):
+    """
+    在线程中执行 file_handle，解析好的 chunk 通过有界队列交给事件循环，
+    读取和解析文件时正在执行的数据库任务不会被阻塞，队列满时解析线程等待
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    slots = threading.Semaphore(max_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # 事件循环已关闭
+            stop.set()
+
+    def produce():
+        item = done
+        try:
+            for sql_part in file_handle(filename, base_format, committed_part, ignore_part_start, ignore_part_end,
+                                        args):
+                # 带超时等待，生成器没有被关闭时也不会一直阻塞
+                while not slots.acquire(timeout=1):
+                    if stop.is_set() or loop.is_closed():
+                        return
+                if stop.is_set():
+                    return
+                put(sql_part)
+        except Exception as e:
+            item = e
+        if not stop.is_set():
+            put(item)
+        return
+
+    # 守护线程不会阻塞解释器退出（to_thread 的线程池在退出时会等待线程结束）
+    producer = threading.Thread(target=produce, name='file-handle', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            slots.release()
+            yield item
+    finally:
+        # 提前结束时让等待中的解析线程退出
+        stop.set()
+        slots.release()
+        await asyncio.to_thread(producer.join)
@@ -1,26 +1,63 @@
 # !/usr/bin/env python3
 # -*- coding:utf8 -*-
 import sys
-import pendulum
+import time
+import asyncio
+from datetime import timedelta
 from loguru import logger
 from pathlib import Path
 
 py_file_path = Path(sys.argv[0])
 py_file_pre = py_file_path.parts[-1].replace('.py', '')
 log_file = py_file_path.parent / 'logs' / f'{py_file_pre}.log'
-log_file.parent.mkdir(exist_ok=True, parents=True)
-logger.add(log_file, rotation='100MB', colorize=True, retention=10, compression='zip', enqueue=True)
+
+
+def add_log_file_sink():
+    """延迟到确定有任务需要执行时才添加日志文件，无任务时可以尽快退出"""
+    log_file.parent.mkdir(exist_ok=True, parents=True)
+    logger.add(log_file, rotation='100MB', colorize=True, retention=10, compression='zip', enqueue=True)
+    return
+
+
+class LoopLagMonitor(object):
+    """
+    每隔 interval 秒唤醒一次，实际唤醒时间与预期时间的差就是事件循环的延迟，
+    延迟大说明有阻塞事件循环的操作，所有协程（包括正在执行的 SQL）都会被推迟
+    """
+
+    def __init__(self, interval=0.1, warning_threshold=0.1):
+        self.interval = interval
+        self.warning_threshold = warning_threshold
+        self.count = 0
+        self.total_lag = 0
+        self.max_lag = 0
+        self.slow_count = 0
+
+    async def run(self):
+        while True:
+            ts_start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - ts_start - self.interval, 0)
+            self.count += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            if self.warning_threshold and lag > self.warning_threshold:
+                self.slow_count += 1
+                logger.warning(f'Event loop blocked for {lag * 1000:.0f}ms')
+
+    def report(self):
+        if self.count:
+            logger.info(f'[Event loop lag] [avg: {self.total_lag / self.count * 1000:.1f}ms] '
+                        f'[max: {self.max_lag * 1000:.1f}ms] [slow: {self.slow_count}/{self.count}]')
+        return
 
 
 def ts_now() -> int:
-    return int(pendulum.now().timestamp())
+    return int(time.time())
 
 
 def ts_interval(ts1: int = 0, ts2: int = 0):
-    ts1 = pendulum.from_timestamp(ts1)
-    ts2 = pendulum.from_timestamp(ts2)
-    result = pendulum.interval(ts1, ts2, absolute=True).as_duration()
-    return result
+    return timedelta(seconds=abs(ts1 - ts2))
 
 
 async def get_log_format(args, sql_file):
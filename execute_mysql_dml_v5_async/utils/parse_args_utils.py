@@ -5,6 +5,7 @@ import configargparse
 import sys
 from pathlib import Path
 from .other_utils import logger, py_file_path, py_file_pre
+from .session_utils import load_session_profile
 
 
 def parse_args():
@@ -14,7 +15,8 @@ def parse_args():
         description='Parse Args', add_help=False,
         formatter_class=configargparse.ArgumentDefaultsHelpFormatter,
         config_file_parser_class=configargparse.YAMLConfigFileParser,
-        default_config_files=['conf.d/*.yaml'],  # 可以设置更多路径
+        # 可以设置更多路径，目录不存在时不设置，减少启动耗时
+        default_config_files=['conf.d/*.yaml'] if Path('conf.d').is_dir() else [],
     )
     parser.add_argument('--help', dest='help', action='store_true',
                         help='help information', default=False)
@@ -37,6 +39,16 @@ def parse_args():
                                  help='MySQL Charset')
     connect_setting.add_argument('--collation', dest='collation', type=str, default='utf8mb4_general_ci',
                                  help='MySQL collation')
+    connect_setting.add_argument('--session-profile', dest='session_profile', type=str, default='',
+                                 help='JSON file of session variables set after connect and restored before close, '
+                                      'e.g. {"default": {"unique_checks": 0}, '
+                                      '"files": {"*_big.sql": {"foreign_key_checks": 0}}}, '
+                                      'variables under "files" apply to the first matched file name pattern.')
+    connect_setting.add_argument('--session-var', dest='session_var', type=str, action='append', default=[],
+                                 help='Session variable set after connect, override default variables of '
+                                      '--session-profile, format: name=value, can be used multiple times. '
+                                      'e.g. --session-var unique_checks=0 '
+                                      '--session-var transaction_isolation=READ-COMMITTED')
 
     schema = parser.add_argument_group('schema filter')
     schema.add_argument('-d', '--database', dest='database', type=str, default='',
@@ -84,6 +96,20 @@ def parse_args():
                          help='Once commit one part, save it into result file. '
                               'If set to True, the execute time will be much longer.')
 
+    execute.add_argument('--loop-lag-warning', dest='loop_lag_warning', type=float, default=100,
+                         help='Warn when the event loop is blocked longer than this milliseconds, '
+                              '0 means do not warn. Lag statistics are reported at the end anyway.')
+
+    rate_limit = parser.add_argument_group('rate limit')
+    rate_limit.add_argument('--rate-limit', dest='rate_limit', type=float, default=0,
+                            help='Max number of statements or affected rows per second, 0 means no limit. '
+                                 'Shared by all threads of this process.')
+    rate_limit.add_argument('--rate-limit-unit', dest='rate_limit_unit', type=str, default='statements',
+                            choices=['statements', 'rows'], help='Unit of rate limit.')
+    rate_limit.add_argument('--rate-limit-file', dest='rate_limit_file', type=str, default='',
+                            help='Share the rate limit with other processes on the same host which use the same '
+                                 'file, e.g. /tmp/execute_mysql_dml_3306.bucket')
+
     action = parser.add_argument_group('action method')
     action.add_argument('--stop-never', dest='stop_never', action='store_true', default=False,
                         help='Never stop executed file or file in file dir if file increasing')
@@ -122,6 +148,22 @@ def parse_args_from_command_line(args: configargparse):
         logger.error(f'File dir {args.file_dir} does not exists.')
         sys.exit(1)
 
+    try:
+        args.session_variables, args.file_session_variables = load_session_profile(
+            args.session_profile, args.session_var
+        )
+    except (ValueError, OSError) as e:
+        logger.error(f'Invalid session profile: {e}')
+        sys.exit(1)
+
+    if args.loop_lag_warning < 0:
+        logger.error(f'Invalid value of loop lag warning')
+        sys.exit(1)
+
+    if args.rate_limit < 0:
+        logger.error(f'Invalid value of rate limit')
+        sys.exit(1)
+
     if args.sleep < 0:
         logger.error(f'Invalid value of sleep')
         sys.exit(1)
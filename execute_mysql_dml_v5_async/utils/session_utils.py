@@ -0,0 +1,115 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import re
+import json
+from fnmatch import fnmatch
+from pathlib import Path
+from .other_utils import logger
+
+variable_name_regex = re.compile(r'^\w+$')
+integer_regex = re.compile(r'^-?\d+$')
+ACCESS_DENIED_ERRNO = {1227}  # 需要 SUPER、SYSTEM_VARIABLES_ADMIN 等权限的变量，如 sql_log_bin
+BOOLEAN_VALUES = {'ON': '1', 'TRUE': '1', 'OFF': '0', 'FALSE': '0'}
+
+
+def check_session_variables(variables):
+    """变量名只允许字母数字下划线（会拼接进 SET 语句），整数字符串转换成整数，布尔类型的变量不接受 '0' 这样的字符串"""
+    if not isinstance(variables, dict):
+        raise ValueError(f'Session variables must be a dict: {variables}')
+    checked_variables = {}
+    for name, value in variables.items():
+        if not variable_name_regex.match(name):
+            raise ValueError(f'Invalid session variable name: {name}')
+        if isinstance(value, str) and integer_regex.match(value.strip()):
+            value = int(value)
+        checked_variables[name.lower()] = value
+    return checked_variables
+
+
+def parse_session_vars(session_var_list):
+    """['unique_checks=0', 'transaction_isolation=READ-COMMITTED'] -> {'unique_checks': 0, ...}"""
+    variables = {}
+    for session_var in session_var_list or []:
+        if '=' not in session_var:
+            raise ValueError(f'Invalid session variable: {session_var}, format: name=value')
+        name, value = session_var.split('=', 1)
+        variables[name.strip()] = value.strip()
+    return check_session_variables(variables)
+
+
+def load_session_profile(profile_file, session_var_list):
+    """
+    读取会话变量配置，返回 (默认变量, [(文件名模式, 变量)])，配置文件为 JSON，如：
+    {"default": {"unique_checks": 0}, "files": {"*_big.sql": {"foreign_key_checks": 0}}}
+    --session-var 覆盖配置文件中的默认变量，文件按 files 中的顺序匹配第一个模式
+    """
+    profile = {}
+    if profile_file:
+        profile = json.loads(Path(profile_file).read_text())
+        if not isinstance(profile, dict):
+            raise ValueError(f'Session profile must be a dict: {profile_file}')
+
+    default_variables = check_session_variables(profile.get('default', {}))
+    default_variables.update(parse_session_vars(session_var_list))
+    file_session_variables = [
+        (pattern, check_session_variables(variables)) for pattern, variables in profile.get('files', {}).items()
+    ]
+    return default_variables, file_session_variables
+
+
+def is_variable_applied(expected, actual):
+    """比较设置的值和查询到的值，忽略大小写，ON/OFF 与 1/0 等价，数字按数值比较"""
+    expected = BOOLEAN_VALUES.get(str(expected).upper(), str(expected).upper())
+    actual = BOOLEAN_VALUES.get(str(actual).upper(), str(actual).upper())
+    if expected == actual:
+        return True
+    try:
+        return float(expected) == float(actual)
+    except ValueError:
+        return False
+
+
+def get_session_variables(args, sql_file):
+    """默认变量加上文件名匹配的第一个模式的变量"""
+    variables = dict(args.session_variables)
+    for pattern, file_variables in args.file_session_variables:
+        if fnmatch(Path(sql_file).name, pattern) or fnmatch(str(sql_file), pattern):
+            variables.update(file_variables)
+            break
+    return variables
+
+
+async def get_session_variable(cursor, name):
+    await cursor.execute(f'SELECT @@SESSION.{name}')
+    return (await cursor.fetchone())[0]
+
+
+async def set_session_variables(cursor, variables):
+    """
+    设置会话变量并查询校验，返回设置前的原值用于恢复，
+    没有权限设置的变量（如 sql_log_bin）跳过，其他错误或校验不通过时抛出异常
+    """
+    original_variables = {}
+    for name, value in variables.items():
+        original_value = await get_session_variable(cursor, name)
+        try:
+            await cursor.execute(f'SET SESSION {name} = %s', (value,))
+        except Exception as e:
+            if getattr(e, 'errno', None) not in ACCESS_DENIED_ERRNO:
+                raise e
+            logger.warning(f'No privilege to set session variable {name}, skip it. {e}')
+            continue
+        original_variables[name] = original_value
+
+        actual = await get_session_variable(cursor, name)
+        if not is_variable_applied(value, actual):
+            raise RuntimeError(f'Session variable {name} is {actual} after set to {value}')
+    # SELECT 可能开启了事务，结束后 DML 才在新的事务中执行，用 rollback 结束不会提交任何修改
+    await cursor.execute('rollback')
+    return original_variables
+
+
+async def restore_session_variables(cursor, original_variables):
+    for name, value in original_variables.items():
+        await cursor.execute(f'SET SESSION {name} = %s', (value,))
+    return
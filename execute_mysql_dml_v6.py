@@ -2,125 +2,546 @@
 # -*- coding:utf8 -*-
 import re
 import sys
+import signal
 import time
 from copy import deepcopy
+from functools import partial
 from pathlib import Path
 from utils.mysql_utils import MySQLUtils
 from utils.file_utils import modify_idx_record_list, sort_start, save_executed_result, \
-    get_file_executed_record, file_handle, get_sql_file_list
+    get_file_executed_record, file_handle, get_sql_file_list, save_executed_results, is_stream_key
 from utils.parse_args_utils import parse_args_from_command_line
-from utils.other_utils import logger, get_log_format, ts_now, ts_interval
+from utils.other_utils import logger, get_log_format, ts_now, ts_interval, add_log_file_sink
+from utils.preflight_utils import preflight_check
+from utils.schedule_utils import FileScheduler, parse_dir_weights
+from utils.rate_limit_utils import get_rate_limiter
+from utils.retry_utils import ChunkError, run_with_retry, split_failed_part, save_rejected_line, \
+    is_connection_lost, reconnect_with_retry, check_connection
+from utils.stats_utils import statement_stats
+from utils.profile_utils import stage_profiler
+from utils.log_utils import LineSummary
+from utils.sql_utils import get_sql_fingerprint
+from utils.table_utils import TableMetaCache
+from utils.reduce_utils import StatementReducer
+from utils.session_utils import SessionProfile
 
 
-def execute_sql(cursor, sql_list, sql_idx_list, args, base_format, info_format):
-    is_finished = False
+def execute_chunk(cursor, sql_list, sql_idx_list, args, line_summary=None, before_commit=None, sql_file=''):
     affected_rows = 0
     sql_idx = 0
     sql = ''
 
     try:
-        for sql, sql_idx in zip(sql_list, sql_idx_list):
-            try:
-                cursor.execute(sql)
-            except Exception as e:
-                if args.skip_error_regex and re.search(args.skip_error_regex, str(e)) is not None:
-                    pass
-                else:
-                    raise e
-            affected_rows += cursor.rowcount
-        else:
+        with stage_profiler.stage('execute'):
+            for sql, sql_idx in zip(sql_list, sql_idx_list):
+                ts_start = time.perf_counter() if args.statement_stats else 0
+                try:
+                    cursor.execute(sql)
+                except Exception as e:
+                    if args.skip_error_regex and re.search(args.skip_error_regex, str(e)) is not None:
+                        if line_summary is not None:
+                            line_summary.add(f'Skip error ({get_sql_fingerprint(str(e))})', sql_idx, f'{e} {sql}')
+                    else:
+                        raise e
+                affected_rows += cursor.rowcount
+                if args.statement_stats:
+                    statement_stats.record(sql, time.perf_counter() - ts_start, cursor.rowcount, sql_file)
 
+        sql_idx = None
+        sql = 'commit'
+        with stage_profiler.stage('commit'):
+            if before_commit is not None:
+                before_commit(cursor, sql_idx_list)
             cursor.execute('commit')
-            committed_line_range = ",".join(modify_idx_record_list(sql_idx_list))
-            logger.info(info_format + f'[Committed line range: {committed_line_range}] '
-                                      f'[Affected rows: {affected_rows}]')
-            is_finished = True
-    except Exception as e:
-        cursor.execute('rollback')
-        logger.exception(base_format + str(e))
-        err_msg = base_format + '[Error line: %s] %s' % (sql_idx, sql)
-        logger.error(err_msg)
+    except BaseException as e:
+        # KeyboardInterrupt 等也要回滚，否则之后保存进度时会把执行了一半的 chunk 一起提交
+        try:
+            cursor.execute('rollback')
+        except Exception as rollback_error:
+            # 连接已断开时无法回滚，服务端会回滚未提交的事务
+            logger.warning(f'Rollback failed: {rollback_error}')
+        if not isinstance(e, Exception):
+            raise e
+        raise ChunkError(e, sql_idx, sql)
+    return affected_rows
+
+
+def reconnect_after_connection_lost(mysql_obj, error, part_idx_list, args, base_format, is_committed=None):
+    """
+    连接断开后重连，返回断开前 chunk 是否已提交。执行语句时断开，服务端会回滚未提交的事务；
+    提交时断开无法确定是否已提交，只有使用 --progress-table 时才能通过进度表判断，否则退出
+    """
+    reconnect_with_retry(mysql_obj, args, base_format)
+    if error.sql_idx is not None:
+        return False
+    if is_committed is None:
+        logger.error(base_format + f'Connection lost at commit, can not tell whether line range '
+                                   f'[{",".join(modify_idx_record_list(sorted(part_idx_list)))}] is committed, '
+                                   f'check it and restart. Use --progress-table to resume automatically.')
         sys.exit(1)
+    return is_committed(part_idx_list)
+
 
-    return is_finished, sql_idx_list
+def execute_sql(mysql_obj, sql_list, sql_idx_list, args, base_format, info_format, line_summary=None,
+                before_commit=None, rate_limiter=None, reducer=None, is_committed=None, sql_file=''):
+    """连接断开时重连，从内存中重新执行未提交的 chunk，同一个 chunk 连接断开超过 --reconnect-times 次时退出"""
+    committed_idx_list = []
+    rejected_idx_list = []
+    parts = [(sql_list, sql_idx_list)]
+    eliminated_idx_list = []
+    if reducer is not None:
+        reduced_sql_list, reduced_idx_list, eliminated_idx_list = reducer.reduce(sql_list, sql_idx_list)
+        if eliminated_idx_list:
+            parts = [(reduced_sql_list, reduced_idx_list)]
+
+    def record_with_eliminated(record_cursor, record_idx_list):
+        # 被消除的行和消除后的 chunk 在同一个事务中记录为已提交
+        before_commit(record_cursor, record_idx_list + eliminated_idx_list)
+
+    lost_times = 0
+    while parts:
+        part_sql_list, part_idx_list = parts.pop(0)
+        try:
+            affected_rows = run_with_retry(
+                execute_chunk, args, base_format, mysql_obj.cursor, part_sql_list, part_idx_list, args,
+                line_summary,
+                record_with_eliminated if eliminated_idx_list and before_commit is not None else before_commit,
+                sql_file
+            )
+        except ChunkError as e:
+            err_msg = base_format + '[Error line: %s] %s' % (e.sql_idx, e.sql)
+            if args.reconnect_times and is_connection_lost(mysql_obj, e.error):
+                lost_times += 1
+                if lost_times > args.reconnect_times:
+                    # 同一个 chunk 反复断开（如语句超过 max_allowed_packet），重连无法解决
+                    logger.error(err_msg + f' [Connection lost {lost_times} times executing the same chunk] {e}')
+                    sys.exit(1)
+                logger.warning(err_msg + f' [Connection lost] {e}')
+                if not reconnect_after_connection_lost(mysql_obj, e, part_idx_list, args, base_format,
+                                                       is_committed):
+                    logger.warning(base_format + f'[Re-execute uncommitted chunk of {len(part_sql_list)} lines]')
+                    parts.insert(0, (part_sql_list, part_idx_list))
+                    continue
+                logger.warning(base_format + '[Chunk was committed before connection lost]')
+                affected_rows = 0
+            else:
+                if eliminated_idx_list:
+                    # 消除后的 chunk 执行失败时按原始语句重新执行，错误信息和行号与不消除时一致
+                    logger.warning(err_msg + f' [Re-execute chunk without eliminating redundant statements] {e}')
+                    parts = [(sql_list, sql_idx_list)]
+                    eliminated_idx_list = []
+                    continue
+                if not args.bisect_error:
+                    logger.exception(base_format + str(e))
+                    logger.error(err_msg)
+                    sys.exit(1)
+
+                if len(part_sql_list) == 1:
+                    logger.error(err_msg + f' [Rejected] {e}')
+                    save_rejected_line(args.reject_file, base_format, part_idx_list[0], part_sql_list[0], e)
+                    rejected_idx_list += part_idx_list
+                else:
+                    logger.warning(err_msg + f' [Split chunk of {len(part_sql_list)} lines] {e}')
+                    parts = split_failed_part(part_sql_list, part_idx_list, e.sql_idx) + parts
+                continue
+
+        lost_times = 0
+        committed_idx_list += part_idx_list
+        committed_line_range = ",".join(modify_idx_record_list(sorted(part_idx_list)))
+        logger.info(info_format + f'[Committed line range: {committed_line_range}] '
+                                  f'[Affected rows: {affected_rows}]')
+        if eliminated_idx_list:
+            committed_idx_list += eliminated_idx_list
+            eliminated_line_range = ",".join(modify_idx_record_list(sorted(eliminated_idx_list)))
+            logger.info(info_format + f'[Eliminated redundant line range: {eliminated_line_range}]')
+            eliminated_idx_list = []
+        if rate_limiter is not None:
+            # 提交之后再限速，等待期间不持有锁
+            with stage_profiler.stage('sleep'):
+                rate_limiter.consume(len(part_sql_list) if args.rate_limit_unit == 'statements' else affected_rows)
+
+    return not rejected_idx_list, committed_idx_list, rejected_idx_list
 
 
 def execute_task(task, committed_part, unfinished_line_parts, args, sql_file):
-    is_finished, sql_idx_list = task
-    if is_finished:
-        committed_part += sql_idx_list
-        if args.save_per_commit:
-            committed_part.sort(key=sort_start)
-            save_executed_result(args.result_file, sql_file, modify_idx_record_list(committed_part))
-    else:
-        unfinished_line_parts.extend(modify_idx_record_list(sql_idx_list))
+    is_finished, sql_idx_list, rejected_idx_list = task
+    committed_part += sql_idx_list
+    # --stream-resume 时流没有结束前每次提交后都要保存，否则中断后无法从上次提交的位置继续
+    if sql_idx_list and (args.save_per_commit or (is_stream_key(sql_file) and args.stream_resume)) \
+            and not args.progress_table:
+        committed_part.sort(key=sort_start)
+        committed_part[:] = modify_idx_record_list(committed_part)
+        with stage_profiler.stage('save_progress'):
+            save_executed_result(args.result_file, sql_file, committed_part)
+    if not is_finished:
+        unfinished_line_parts.extend(modify_idx_record_list(rejected_idx_list))
     return True
 
 
-def execute_sql_from_file(args, sql_file, cursor):
-    if not Path(sql_file).exists():
+def iter_execute_sql_from_file(args, sql_file, mysql_obj, progress_store=None, executor=None, rate_limiter=None,
+                               reducer=None, session_profile=None, insert_sorter=None):
+    """每执行完一个 chunk 就 yield 一次，调度器可以在 chunk 之间切换到其他文件"""
+    stream = is_stream_key(sql_file)
+    if not stream and not Path(sql_file).exists():
         logger.error(f'File {sql_file} does not exists.')
-        return False
+        return
 
     logger.info(f'Execute commands from file [{sql_file}]')
     base_format, info_format, finished_info = get_log_format(args, sql_file)
-    committed_part, committed_part_start, committed_part_end = get_file_executed_record(args, sql_file)
+    if progress_store is None:
+        committed_part, committed_part_start, committed_part_end = get_file_executed_record(args, sql_file)
+        before_commit = None
+        is_committed = None
+    else:
+        committed_part, committed_part_start, committed_part_end = progress_store.get_file_executed_record(
+            args, sql_file
+        )
+        before_commit = partial(progress_store.record, sql_file=sql_file)
+        is_committed = partial(progress_store.is_committed, sql_file=sql_file)
+    if stream and not args.stream_resume:
+        # 每次写入的流都是新的内容，序号从 1 开始，不能跳过上一次运行提交的序号
+        committed_part, committed_part_start, committed_part_end = [], [], []
     unfinished_line_parts = []
     executed_all_parts = False
+    stream_ended = False
+    line_summary = LineSummary(base_format, args.log_ignored_lines, args.log_summary_interval)
+
+    # 只在用到时导入的模块，没有任务时尽快退出（cron 每分钟启动一次）
+    if stream:
+        from utils.stream_utils import stream_handle
+
+        sql_parts = stream_handle(sql_file, base_format, committed_part_start, committed_part_end, args,
+                                  line_summary)
+    elif executor is None:
+        sql_parts = file_handle(sql_file, base_format, committed_part, deepcopy(committed_part_start),
+                                deepcopy(committed_part_end), args, line_summary)
+    else:
+        from utils.parallel_utils import parallel_file_handle
+
+        sql_parts = parallel_file_handle(executor, sql_file, base_format, committed_part, committed_part_start,
+                                         committed_part_end, args, line_summary)
+    if not stream and insert_sorter is not None and insert_sorter.is_enabled(sql_file):
+        sql_parts = insert_sorter.sort_chunks(sql_parts, sql_file)
 
     try:
-        for i, (sql_list, sql_idx_list) in enumerate(file_handle(sql_file, base_format, committed_part,
-                                                                 deepcopy(committed_part_start),
-                                                                 deepcopy(committed_part_end), args)):
+        for i, (sql_list, sql_idx_list) in enumerate(stage_profiler.iter_stage('parse', sql_parts)):
             if sql_list:
+                if session_profile is not None:
+                    # 调度器会在 chunk 之间切换文件，每个 chunk 执行前切换到本文件的会话变量
+                    session_profile.apply(sql_file)
                 task = execute_sql(
-                    cursor, sql_list, sql_idx_list, args, base_format, info_format
+                    mysql_obj, sql_list, sql_idx_list, args, base_format, info_format, line_summary, before_commit,
+                    rate_limiter, reducer, is_committed, sql_file
                 )
                 execute_task(task, committed_part, unfinished_line_parts, args, sql_file)
-                time.sleep(args.interval)
+                if args.statement_stats:
+                    statement_stats.report_if_requested(args.statement_stats_top)
+                with stage_profiler.stage('sleep'):
+                    time.sleep(args.interval)
+                yield True
             else:
                 committed_part += sql_idx_list
         else:
+            stream_ended = stream
             if unfinished_line_parts:
                 logger.error(info_format + f'Not all tasks finished, unfinished line parts: '
                                            f'[{",".join(unfinished_line_parts)}]')
             else:
                 executed_all_parts = True
                 logger.info(finished_info)
-                if args.delete_executed_file and int(ts_now() - Path(sql_file).stat().st_mtime) > 60:
+                if not stream and args.delete_executed_file and \
+                        int(ts_now() - Path(sql_file).stat().st_mtime) > 60:
                     Path(sql_file).unlink()
     finally:
+        line_summary.log()
         committed_part.sort(key=sort_start)
         committed_part = modify_idx_record_list(committed_part)
-        save_executed_result(
-            args.result_file, sql_file, committed_part, args.delete_not_exists_file_record,
-            executed_all_parts
+        if stream_ended or (stream and not args.stream_resume):
+            # 流结束后下一个写入方的序号重新从 1 开始，清除记录
+            committed_part = []
+        with stage_profiler.stage('save_progress'):
+            if progress_store is None:
+                save_executed_result(
+                    args.result_file, sql_file, committed_part, args.delete_not_exists_file_record,
+                    executed_all_parts
+                )
+            else:
+                progress_store.save_executed_result(
+                    mysql_obj.cursor, sql_file, committed_part, args.delete_not_exists_file_record, executed_all_parts
+                )
+        if args.statement_stats:
+            statement_stats.report(args.statement_stats_top, base_format, statement_stats.finish_file(sql_file))
+    return
+
+
+def execute_sql_from_file(args, sql_file, mysql_obj, progress_store=None, executor=None, rate_limiter=None,
+                          session_profile=None):
+    for _ in iter_execute_sql_from_file(args, sql_file, mysql_obj, progress_store, executor, rate_limiter,
+                                        session_profile=session_profile):
+        pass
+    return True
+
+
+def read_small_sql_file(args, sql_file, progress_store=None):
+    """读取小文件中所有未提交的 SQL，用于组提交"""
+    if not Path(sql_file).exists():
+        logger.error(f'File {sql_file} does not exists.')
+        return None
+
+    base_format, info_format, finished_info = get_log_format(args, sql_file)
+    if progress_store is None:
+        committed_part, committed_part_start, committed_part_end = get_file_executed_record(args, sql_file)
+    else:
+        committed_part, committed_part_start, committed_part_end = progress_store.get_file_executed_record(
+            args, sql_file
         )
+    line_summary = LineSummary(base_format, args.log_ignored_lines, args.log_summary_interval)
+    file_info = {
+        'sql_file': sql_file, 'info_format': info_format, 'finished_info': finished_info,
+        'committed_part': committed_part, 'sql_list': [], 'sql_idx_list': [], 'ignore_idx_list': []
+    }
+    sql_parts = file_handle(sql_file, base_format, committed_part, committed_part_start, committed_part_end, args,
+                            line_summary)
+    for sql_list, sql_idx_list in stage_profiler.iter_stage('parse', sql_parts):
+        if sql_list:
+            file_info['sql_list'] += sql_list
+            file_info['sql_idx_list'] += sql_idx_list
+        else:
+            file_info['ignore_idx_list'] += sql_idx_list
+    line_summary.log()
+    return file_info
+
+
+def execute_file_group(args, file_info_list, mysql_obj, progress_store=None, rate_limiter=None,
+                       session_profile=None):
+    """多个小文件在同一个事务中执行，只提交一次并一次性保存所有文件的已提交行"""
+    sql_list = [sql for file_info in file_info_list for sql in file_info['sql_list']]
+    position_list = list(range(len(sql_list)))
+    # 组内的位置 -> (文件, 行号)
+    group_lines = [(file_info['sql_file'], idx) for file_info in file_info_list for idx in file_info['sql_idx_list']]
+    file_names = ','.join(str(file_info['sql_file']) for file_info in file_info_list)
+    base_format = '[Group commit: %s files] ' % len(file_info_list)
+
+    def before_commit(group_cursor, _):
+        if progress_store is not None:
+            for info in file_info_list:
+                progress_store.record(group_cursor, info['sql_idx_list'] + info['ignore_idx_list'], info['sql_file'])
+
+    if session_profile is not None:
+        session_profile.apply(file_info_list[0]['sql_file'])
+    line_summary = LineSummary(base_format, args.log_ignored_lines, args.log_summary_interval,
+                               get_line_name=lambda position: '%s:%s' % group_lines[position])
+    try:
+        affected_rows = run_with_retry(
+            execute_chunk, args, base_format, mysql_obj.cursor, sql_list, position_list, args, line_summary,
+            before_commit
+        )
+    except ChunkError as e:
+        line_summary.log()
+        error_msg = f'[Error at commit] {e}'
+        if e.sql_idx is not None:
+            error_file, error_line = group_lines[e.sql_idx]
+            error_msg = f'[Error file: {error_file}] [Error line: {error_line}] {e.sql} {e}'
+        logger.error(base_format + error_msg)
+        if args.reconnect_times and is_connection_lost(mysql_obj, e.error):
+            # 逐个执行时重新读取已提交的行，提交时断开也只有进度表能判断组是否已提交
+            if e.sql_idx is None and progress_store is None:
+                logger.error(base_format + f'Connection lost at commit, can not tell whether files [{file_names}] '
+                                           f'are committed, check them and restart.')
+                sys.exit(1)
+            reconnect_with_retry(mysql_obj, args, base_format)
+        logger.error(base_format + f'[Rolled back files: {file_names}], execute them one by one.')
+        for file_info in file_info_list:
+            execute_sql_from_file(args, file_info['sql_file'], mysql_obj, progress_store, rate_limiter=rate_limiter,
+                                  session_profile=session_profile)
+        return False
+
+    line_summary.log()
+    committed_parts = {}
+    for file_info in file_info_list:
+        committed_part = file_info['committed_part'] + file_info['sql_idx_list'] + file_info['ignore_idx_list']
+        committed_part.sort(key=sort_start)
+        committed_parts[file_info['sql_file']] = modify_idx_record_list(committed_part)
+        if file_info['sql_idx_list']:
+            committed_line_range = ",".join(modify_idx_record_list(file_info['sql_idx_list']))
+            logger.info(file_info['info_format'] + f'[Committed line range: {committed_line_range}]')
+        logger.info(file_info['finished_info'])
+    logger.info(base_format + f'[Affected rows: {affected_rows}]')
+    if args.statement_stats:
+        statement_stats.report_if_requested(args.statement_stats_top)
+
+    if progress_store is None:
+        with stage_profiler.stage('save_progress'):
+            save_executed_results(args.result_file, committed_parts, args.delete_not_exists_file_record)
+    for file_info in file_info_list:
+        sql_file = file_info['sql_file']
+        if args.delete_executed_file and int(ts_now() - Path(sql_file).stat().st_mtime) > 60:
+            Path(sql_file).unlink()
+
+    with stage_profiler.stage('sleep'):
+        if rate_limiter is not None:
+            rate_limiter.consume(len(sql_list) if args.rate_limit_unit == 'statements' else affected_rows)
+        time.sleep(args.interval)
     return True
 
 
+def execute_sql_from_small_files(args, sql_file_list, mysql_obj, progress_store=None, rate_limiter=None,
+                                 session_profile=None):
+    """
+    将连续的小文件打包，每组 SQL 总数不超过 --chunk，SQL 数超过 --chunk 的文件单独按原方式执行，
+    会话变量不同的文件不放在同一组
+    """
+    file_info_list = []
+    statement_count = 0
+    group_variables = None
+    for sql_file in sql_file_list:
+        file_info = read_small_sql_file(args, sql_file, progress_store)
+        if file_info is None:
+            continue
+        if not file_info['sql_list'] and not file_info['ignore_idx_list']:
+            continue
+
+        if len(file_info['sql_list']) > args.chunk:
+            # 先执行已经打包的文件，保持调度顺序
+            if file_info_list:
+                execute_file_group(args, file_info_list, mysql_obj, progress_store, rate_limiter, session_profile)
+                file_info_list = []
+                statement_count = 0
+            execute_sql_from_file(args, sql_file, mysql_obj, progress_store, rate_limiter=rate_limiter,
+                                  session_profile=session_profile)
+            continue
+        variables = session_profile.get_variables(sql_file) if session_profile is not None else None
+        if file_info_list and (statement_count + len(file_info['sql_list']) > args.chunk
+                               or variables != group_variables):
+            execute_file_group(args, file_info_list, mysql_obj, progress_store, rate_limiter, session_profile)
+            file_info_list = []
+            statement_count = 0
+        group_variables = variables
+        file_info_list.append(file_info)
+        statement_count += len(file_info['sql_list'])
+
+    if file_info_list:
+        execute_file_group(args, file_info_list, mysql_obj, progress_store, rate_limiter, session_profile)
+    return True
+
+
+def rescan_sql_file_list(args, scheduler, last_scan_time):
+    """--stop-never 模式下每隔 rescan_interval 秒扫描一次新文件加入调度队列，返回本次扫描时间"""
+    if not args.stop_never or time.monotonic() - last_scan_time < args.rescan_interval:
+        return last_scan_time
+    scheduler.add_files([f for f in get_sql_file_list(args) if not is_stream_key(f)])
+    return time.monotonic()
+
+
 def main(args, execute_file_list):
     ts_start = ts_now()
     mysql_obj = MySQLUtils(
         host=args.host, port=args.port, socket=args.socket, user=args.user, password=args.password,
-        database=args.database, charset=args.charset, collation=args.collation
+        database=args.database, charset=args.charset, collation=args.collation,
+        session_variables=args.session_variables, connector=args.connector
     )
+    session_profile = SessionProfile(mysql_obj, args.session_variables, args.file_session_variables)
+    executor = None
+    if args.parse_workers > 0:
+        # multiprocessing 导入耗时较长，只在使用进程池解析时导入
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(args.parse_workers)
+    rate_limiter = get_rate_limiter(args)
+    lease_manager = None
+    if args.lease_dir:
+        from utils.lease_utils import LeaseManager
+
+        lease_manager = LeaseManager(args.lease_dir, args.lease_timeout)
+    scheduler = FileScheduler(args.schedule_policy, args.slice_chunks, parse_dir_weights(args.dir_weight),
+                              args.group_commit_max_size * 1024, lease_manager)
+    if args.statement_stats:
+        # 信号处理函数中不能输出日志，主线程正在输出日志时 loguru 会报错，由执行循环在 chunk 之间输出
+        signal.signal(signal.SIGUSR1, lambda signum, frame: statement_stats.request_report())
+    if args.profile:
+        stage_profiler.start(args.profile_cprofile, args.profile_tracemalloc)
     try:
         mysql_obj.connect2mysql()
 
         if not get_sql_file_list:
             execute_file_list = get_sql_file_list(args)
 
+        progress_store = None
+        if args.progress_table:
+            from utils.progress_utils import ProgressStore
+
+            progress_store = ProgressStore(mysql_obj, args.progress_table)
+
+        if args.preflight:
+            # 预检查不能修改目标库，进度表在预检查之后才创建
+            if progress_store is not None:
+                progress_store.check_table_exists()
+            flagged_templates = preflight_check(args, mysql_obj, execute_file_list, progress_store)
+            if args.preflight == 'report':
+                return
+            if flagged_templates:
+                logger.error(f'Refuse to execute, {len(flagged_templates)} templates failed preflight check.')
+                sys.exit(1)
+        if progress_store is not None:
+            progress_store.create_table()
+
+        table_meta = TableMetaCache(mysql_obj, args.database)
+        reducer = None
+        if args.eliminate_redundant and args.skip_error_regex:
+            # 保留的语句出错被跳过时仍会记录为已提交，被它消除的语句也就丢失了，不做任何消除
+            logger.warning('Redundant statements are not eliminated when --skip-error-regex is set.')
+        elif args.eliminate_redundant:
+            reducer = StatementReducer(table_meta)
+        insert_sorter = None
+        if args.sort_insert_tables or args.sort_insert_file_regex:
+            from utils.order_utils import InsertSorter
+
+            sort_insert_tables = [table.strip() for table in args.sort_insert_tables.split(',') if table.strip()]
+            insert_sorter = InsertSorter(
+                table_meta, args.chunk, sort_insert_tables, args.sort_insert_file_regex, args.sort_insert_window,
+                args.sort_insert_buffer
+            )
+
+        last_scan_time = time.monotonic()
+
+        def rescan():
+            nonlocal last_scan_time
+            last_scan_time = rescan_sql_file_list(args, scheduler, last_scan_time)
+
+        # 传入 mysql_obj 而不是游标，重连后使用新连接的游标
+        start_job = partial(iter_execute_sql_from_file, args, mysql_obj=mysql_obj, progress_store=progress_store,
+                            executor=executor, rate_limiter=rate_limiter, reducer=reducer,
+                            session_profile=session_profile, insert_sorter=insert_sorter)
         while True:
-            for sql_file in execute_file_list:
-                execute_sql_from_file(args, sql_file, mysql_obj.cursor)
+            check_connection(mysql_obj, args)
+            # 标准输入和命名管道一直执行到流结束，不参与调度
+            for stream_key in [f for f in execute_file_list if is_stream_key(f)]:
+                for _ in start_job(stream_key):
+                    pass
+            scheduler.add_files([f for f in execute_file_list if not is_stream_key(f)])
+            scheduler.run(
+                start_job,
+                rescan,
+                partial(execute_sql_from_small_files, args, mysql_obj=mysql_obj, progress_store=progress_store,
+                        rate_limiter=rate_limiter, session_profile=session_profile)
+            )
 
             if not args.stop_never:
                 break
-            time.sleep(args.sleep)
+            with stage_profiler.stage('sleep'):
+                time.sleep(args.sleep)
+            if args.statement_stats:
+                statement_stats.report_if_requested(args.statement_stats_top)
             execute_file_list = get_sql_file_list(args)
+            last_scan_time = time.monotonic()
     finally:
+        scheduler.close()
+        if lease_manager is not None:
+            lease_manager.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
         mysql_obj.close()
+        stage_profiler.report(args.profile_report)
         logger.info('Total used time: %s' % (ts_interval(ts_now(), ts_start)))
     return
 
@@ -143,4 +564,5 @@ if __name__ == "__main__":
             sys.exit(1)
 
     assert command_line_args.database, "No database select."
+    add_log_file_sink()
     main(command_line_args, sql_file_list)
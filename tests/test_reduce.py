@@ -0,0 +1,221 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+"""
+--eliminate-redundant 的单元测试：parse_dml、TableMetaCache（用假的 query() 代替数据库）和 StatementReducer.reduce
+运行：python -m pytest tests 或 python -m unittest discover tests
+"""
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+from utils.sql_utils import parse_dml  # noqa: E402
+from utils.table_utils import TableMetaCache  # noqa: E402
+from utils.reduce_utils import StatementReducer  # noqa: E402
+
+# 表名 -> {'columns': [(列名, COLUMN_KEY, EXTRA, DATA_TYPE)], 'pk': [...], 'triggers': n, 'foreign_keys': n}
+TABLES = {
+    't': {
+        'columns': [
+            ('id', 'PRI', '', 'int'), ('name', '', '', 'varchar'),
+            ('created_at', '', 'DEFAULT_GENERATED', 'timestamp'),
+            ('name_len', '', 'VIRTUAL GENERATED', 'int'), ('name_upper', '', 'STORED GENERATED', 'varchar'),
+        ],
+        'pk': ['id'], 'triggers': 0, 'foreign_keys': 0,
+    },
+    't2': {'columns': [('id', 'PRI', '', 'bigint'), ('v', '', '', 'varchar')], 'pk': ['id'], 'triggers': 0,
+           'foreign_keys': 0},
+    's': {'columns': [('code', 'PRI', '', 'varchar'), ('name', '', '', 'varchar')], 'pk': ['code'], 'triggers': 0,
+          'foreign_keys': 0},
+    'm': {'columns': [('b', 'PRI', '', 'int'), ('a', 'PRI', '', 'varchar'), ('v', '', '', 'int')], 'pk': ['a', 'b'],
+          'triggers': 0, 'foreign_keys': 0},
+    'trig': {'columns': [('id', 'PRI', '', 'int'), ('v', '', '', 'int')], 'pk': ['id'], 'triggers': 1,
+             'foreign_keys': 0},
+}
+
+
+class FakeMySQL(object):
+    """按 SQL 中查询的 information_schema 表返回 TABLES 中的元数据"""
+
+    def __init__(self, tables=None, error=None):
+        self.tables = TABLES if tables is None else tables
+        self.error = error
+        self.queries = []
+
+    def query(self, sql, params=None):
+        self.queries.append((sql, params))
+        if self.error is not None:
+            raise self.error
+        table = self.tables.get(params[1])
+        if 'information_schema.COLUMNS' in sql:
+            return [] if table is None else [
+                {'COLUMN_NAME': name, 'COLUMN_KEY': key, 'EXTRA': extra, 'DATA_TYPE': data_type}
+                for name, key, extra, data_type in table['columns']
+            ]
+        if 'information_schema.STATISTICS' in sql:
+            return [{'COLUMN_NAME': name} for name in table['pk']]
+        if 'information_schema.TRIGGERS' in sql:
+            return [{'cnt': table['triggers']}]
+        if 'information_schema.KEY_COLUMN_USAGE' in sql:
+            return [{'cnt': table['foreign_keys']}]
+        raise ValueError(sql)
+
+
+def reduce(sql_list):
+    reducer = StatementReducer(TableMetaCache(FakeMySQL(), 'db'))
+    return reducer.reduce(sql_list, list(range(1, len(sql_list) + 1)))[2]
+
+
+class ParseDmlTest(unittest.TestCase):
+
+    def test_update(self):
+        self.assertEqual(
+            parse_dml("UPDATE `db`.`t` SET `name` = 'a where b = 1', created_at = NOW() WHERE `id` = '7' LIMIT 1;"),
+            {'type': 'UPDATE', 'table': 'db.t', 'values': {'name': "'a where b = 1'", 'created_at': 'NOW()'},
+             'conditions': {'id': "'7'"}}
+        )
+
+    def test_delete(self):
+        self.assertEqual(
+            parse_dml("delete from t where a = 'x' and b = 2"),
+            {'type': 'DELETE', 'table': 't', 'values': {}, 'conditions': {'a': "'x'", 'b': '2'}}
+        )
+
+    def test_insert(self):
+        self.assertEqual(
+            parse_dml("INSERT INTO t (`id`, name) VALUES (1, 'a, (b)');"),
+            {'type': 'INSERT', 'table': 't', 'values': {'id': '1', 'name': "'a, (b)'"}, 'conditions': {}}
+        )
+
+    def test_unsupported(self):
+        for sql in [
+            "INSERT INTO t (id, name) VALUES (1, 'a'), (2, 'b')",
+            "INSERT IGNORE INTO t (id, name) VALUES (1, 'a')",
+            "INSERT INTO t (id, name) VALUES (1, 'a') ON DUPLICATE KEY UPDATE name = 'a'",
+            "UPDATE t2 SET v = (SELECT name FROM t WHERE id = 1) WHERE id = 1",
+            "UPDATE t JOIN t2 ON t.id = t2.id SET t.name = t2.v WHERE t.id = 1",
+            "UPDATE t SET name = 'a' WHERE id > 1",
+            "UPDATE t SET name = 'a' WHERE id = 1 OR id = 2",
+            "DELETE FROM t WHERE id = NULL",
+            "DELETE FROM t WHERE id = @id",
+            "DELETE FROM t",
+            "SET @a = 1",
+        ]:
+            self.assertIsNone(parse_dml(sql), sql)
+
+
+class TableMetaCacheTest(unittest.TestCase):
+
+    def test_meta(self):
+        self.assertEqual(TableMetaCache(FakeMySQL(), 'db').get('`db`.`t`'), {
+            'pk': ['id'], 'columns': ['id', 'name', 'created_at'], 'integer_columns': ['id', 'name_len'],
+            'has_trigger': False, 'has_foreign_key': False
+        })
+
+    def test_pk_order(self):
+        self.assertEqual(TableMetaCache(FakeMySQL(), 'db').get('m')['pk'], ['a', 'b'])
+
+    def test_cache(self):
+        mysql_obj = FakeMySQL()
+        table_meta = TableMetaCache(mysql_obj, 'db')
+        table_meta.get('t')
+        query_count = len(mysql_obj.queries)
+        self.assertIs(table_meta.get('`T`'), table_meta.get('db.t'))
+        self.assertEqual(len(mysql_obj.queries), query_count)
+        self.assertEqual(table_meta.get_table_key('`DB`.`T`'), 'db.t')
+
+    def test_missing_table_and_error(self):
+        self.assertIsNone(TableMetaCache(FakeMySQL(), 'db').get('not_exists'))
+        mysql_obj = FakeMySQL(error=RuntimeError('lost connection'))
+        table_meta = TableMetaCache(mysql_obj, 'db')
+        self.assertIsNone(table_meta.get('t'))
+        self.assertIsNone(table_meta.get('t'))
+        self.assertEqual(len(mysql_obj.queries), 1)
+
+
+class StatementReducerTest(unittest.TestCase):
+
+    def test_full_row_update(self):
+        self.assertEqual(reduce([
+            "UPDATE t SET name = 'a', created_at = '2020-01-01' WHERE id = 1",
+            "UPDATE t SET name = 'x' WHERE id = 2",
+            "UPDATE t SET name = 'b', created_at = '2021-01-01' WHERE id = '1'",
+        ]), [1])
+
+    def test_partial_update_not_full_row(self):
+        # created_at 的 EXTRA 是 DEFAULT_GENERATED，是可写列，只 SET name 不是全行 UPDATE
+        self.assertEqual(reduce([
+            "UPDATE t SET name = 'a', created_at = '2020-01-01' WHERE id = 1",
+            "UPDATE t SET name = 'b' WHERE id = 1",
+        ]), [])
+
+    def test_non_literal_update_not_full_row(self):
+        self.assertEqual(reduce([
+            "UPDATE t SET name = 'a', created_at = '2020-01-01' WHERE id = 1",
+            "UPDATE t SET name = 'b', created_at = NOW() WHERE id = 1",
+        ]), [])
+
+    def test_unparsed_statement_clears_all_tables(self):
+        self.assertEqual(reduce([
+            "UPDATE t SET name = 'x', created_at = '2020-01-01' WHERE id = 1",
+            "UPDATE t2 SET v = (SELECT name FROM t WHERE id = 1) WHERE id = 1",
+            "UPDATE t SET name = 'y', created_at = '2020-01-01' WHERE id = 1",
+        ]), [])
+
+    def test_trigger_table_clears_all_tables(self):
+        self.assertEqual(reduce([
+            "UPDATE t SET name = 'x', created_at = '2020-01-01' WHERE id = 1",
+            "UPDATE trig SET v = 1 WHERE id = 1",
+            "UPDATE t SET name = 'y', created_at = '2020-01-01' WHERE id = 1",
+        ]), [])
+
+    def test_other_table_keeps_state(self):
+        self.assertEqual(reduce([
+            "UPDATE t SET name = 'x', created_at = '2020-01-01' WHERE id = 1",
+            "UPDATE t2 SET v = 'a' WHERE id = 1",
+            "UPDATE t SET name = 'y', created_at = '2020-01-01' WHERE id = 1",
+        ]), [1])
+
+    def test_same_table_non_key_statement_clears_table(self):
+        self.assertEqual(reduce([
+            "UPDATE t SET name = 'x', created_at = '2020-01-01' WHERE id = 1",
+            "UPDATE t SET name = 'z' WHERE name = 'x'",
+            "UPDATE t SET name = 'y', created_at = '2020-01-01' WHERE id = 1",
+        ]), [])
+
+    def test_insert_delete(self):
+        self.assertEqual(reduce([
+            "INSERT INTO t (id, name) VALUES (7, 'a')",
+            "DELETE FROM t WHERE id = '7'",
+        ]), [1, 2])
+        self.assertEqual(reduce([
+            "INSERT INTO t (id, name) VALUES (7, 'a')",
+            "UPDATE t SET name = 'b' WHERE id = 7",
+            "DELETE FROM t WHERE id = 7",
+        ]), [])
+
+    def test_quoted_string_key(self):
+        # 字符串列中 '007' 和 7 是不同的值
+        self.assertEqual(reduce([
+            "INSERT INTO s (code, name) VALUES ('007', 'a')",
+            "DELETE FROM s WHERE code = 7",
+        ]), [])
+        self.assertEqual(reduce([
+            "INSERT INTO s (code, name) VALUES ('007', 'a')",
+            "DELETE FROM s WHERE code = '007'",
+        ]), [1, 2])
+
+    def test_composite_key(self):
+        self.assertEqual(reduce([
+            "UPDATE m SET v = 1 WHERE a = 'x' AND b = 1",
+            "UPDATE m SET v = 2 WHERE b = '1' AND a = 'x'",
+        ]), [1])
+        self.assertEqual(reduce([
+            "UPDATE m SET v = 1 WHERE a = 'x' AND b = 1",
+            "UPDATE m SET v = 2 WHERE a = 'x'",
+        ]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
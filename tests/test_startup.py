@@ -0,0 +1,73 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+"""
+启动耗时的回归测试：cron 每分钟启动一次，没有任务时的启动耗时要控制在预算内。
+耗时与机器有关，取多次运行的最小值，预算可以用环境变量 IMPORT_TIME_BUDGET_MS / EMPTY_RUN_BUDGET_MS 调整。
+运行：python -m pytest tests 或 python -m unittest discover tests
+"""
+import os
+import re
+import sys
+import time
+import tempfile
+import unittest
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).absolute().parent.parent
+SCRIPT = 'execute_mysql_dml_v6.py'
+MODULE = 'execute_mysql_dml_v6'
+RUNS = 5
+# 导入 execute_mysql_dml_v6 的耗时（-X importtime 的累计时间），其中 loguru 约占一半
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', 150))
+# 没有文件需要执行时整个进程的耗时（包括解释器启动）
+EMPTY_RUN_BUDGET_MS = float(os.environ.get('EMPTY_RUN_BUDGET_MS', 250))
+# 只在用到时才导入的模块，启动时不能被导入
+LAZY_MODULES = [
+    'mysql.connector', 'pendulum', 'concurrent.futures.process', 'cProfile', 'tracemalloc',
+    'utils.lease_utils', 'utils.order_utils', 'utils.parallel_utils', 'utils.progress_utils', 'utils.stream_utils',
+]
+
+
+def run_python(*args, cwd=ROOT):
+    return subprocess.run([sys.executable, *args], cwd=cwd, capture_output=True, text=True)
+
+
+def get_import_time_ms(importtime_output, module):
+    match = re.search(rf'^import time:\s*\d+ \|\s*(\d+) \| {re.escape(module)}$', importtime_output, re.M)
+    return int(match.group(1)) / 1000 if match is not None else None
+
+
+class StartupTest(unittest.TestCase):
+
+    def test_import_time_budget(self):
+        used = []
+        for _ in range(RUNS):
+            result = run_python('-X', 'importtime', '-c', f'import {MODULE}')
+            self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+            used.append(get_import_time_ms(result.stderr, MODULE))
+        self.assertLess(min(used), IMPORT_TIME_BUDGET_MS, f'import {MODULE} used {min(used):.1f} ms')
+
+    def test_lazy_modules(self):
+        result = run_python('-c', f'import sys, {MODULE}; print("\\n".join(sys.modules))')
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        imported = set(result.stdout.split())
+        self.assertEqual([module for module in LAZY_MODULES if module in imported], [])
+
+    def test_empty_run_budget(self):
+        """没有文件时直接退出，不连接数据库、不导入 mysql.connector、不添加日志文件"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            used = []
+            for _ in range(RUNS):
+                ts_start = time.perf_counter()
+                result = run_python('-X', 'importtime', str(ROOT / SCRIPT), '-d', 'db', '-p', 'x', '-f', tmp_dir,
+                                    cwd=tmp_dir)
+                used.append((time.perf_counter() - ts_start) * 1000)
+                self.assertEqual(result.returncode, 1, result.stderr[-2000:])
+                self.assertIn('No sql files', result.stderr)
+                self.assertIsNone(get_import_time_ms(result.stderr, 'mysql.connector'))
+            self.assertLess(min(used), EMPTY_RUN_BUDGET_MS, f'empty run used {min(used):.1f} ms')
+
+
+if __name__ == '__main__':
+    unittest.main()
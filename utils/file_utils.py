@@ -2,8 +2,29 @@
 # -*- coding:utf8 -*-
 import os
 import json
+import fcntl
 from pathlib import Path
 from .other_utils import ts_now, logger
+from .sql_utils import DML_TYPES, get_sql_type
+
+STREAM_PREFIX = 'stream:'
+STDIN_KEY = 'stream:stdin'
+
+
+def is_stream_source(source):
+    """-f - 表示标准输入，-f 命名管道路径表示从管道读取"""
+    return str(source) == '-' or Path(source).is_fifo()
+
+
+def get_stream_key(source):
+    """流的已提交序号保存在 stream:stdin 或 stream:管道绝对路径 下"""
+    if str(source) == '-':
+        return STDIN_KEY
+    return STREAM_PREFIX + str(Path(source).absolute())
+
+
+def is_stream_key(sql_file):
+    return str(sql_file).startswith(STREAM_PREFIX)
 
 
 def get_sql_file_list(args):
@@ -26,6 +47,9 @@ def get_sql_file_list(args):
                 file_list.append(sql_file)
     else:
         for f in args.file_path:
+            if is_stream_source(f):
+                file_list.append(get_stream_key(f))
+                continue
             f = Path(f)
             if (args.file_regex and f.match(args.file_regex)) and \
                     (args.exclude_file_regex and f.match(args.exclude_file_regex) is False):
@@ -38,6 +62,15 @@ def get_sql_file_list(args):
     return file_list
 
 
+def count_file_lines(filename):
+    """与 wc -l 结果一致（统计换行符个数），不需要启动子进程"""
+    line_count = 0
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            line_count += block.count(b'\n')
+    return line_count
+
+
 def read_file(filename):
     with Path(filename).open() as f:
         return json.loads(f.read())
@@ -60,7 +93,7 @@ def get_file_record_part_start_end(part):
 
 def get_file_executed_record(args, sql_file):
     executed_result = read_file(args.result_file) if Path(args.result_file).exists() else {}
-    committed_part = executed_result.get(sql_file, [])
+    committed_part = executed_result.get(str(sql_file), [])
 
     if args.reset:
         committed_part = []
@@ -73,33 +106,54 @@ def get_file_executed_record(args, sql_file):
 
 def save_executed_result(result_file, sql_file, committed_part, delete_not_exists_file_record=False,
                          executed_all_parts=False):
-    sql_file = str(sql_file)
-    executed_result = read_file(result_file) if Path(result_file).exists() else {}
-    executed_result[sql_file] = committed_part
-    if delete_not_exists_file_record and executed_all_parts:
-        for f in executed_result.copy().keys():
-            if not Path(f).exists():
-                del executed_result[f]
-    msg = json.dumps(executed_result, ensure_ascii=False, indent=4) + '\n'
-    with open(result_file, 'w', encoding='utf8') as f:
-        f.write(msg)
+    save_executed_results(result_file, {sql_file: committed_part},
+                          delete_not_exists_file_record and executed_all_parts)
+    return
+
+
+def save_executed_results(result_file, committed_parts, delete_not_exists_file_record=False):
+    """
+    一次写入多个文件的已提交行，committed_parts: {sql_file: committed_part}，
+    多个进程共用一个结果文件时加锁读改写，写入临时文件后原子替换，读取时不会读到写了一半的文件
+    """
+    with open(f'{result_file}.lock', 'a') as lock_file:
+        # lockf 在 NFS 上也能生效
+        fcntl.lockf(lock_file, fcntl.LOCK_EX)
+        executed_result = read_file(result_file) if Path(result_file).exists() else {}
+        for sql_file, committed_part in committed_parts.items():
+            executed_result[str(sql_file)] = committed_part
+        if delete_not_exists_file_record:
+            for f in executed_result.copy().keys():
+                if not is_stream_key(f) and not Path(f).exists():
+                    del executed_result[f]
+        msg = json.dumps(executed_result, ensure_ascii=False, indent=4) + '\n'
+        tmp_file = f'{result_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w', encoding='utf8') as f:
+            f.write(msg)
+        os.replace(tmp_file, result_file)
     return
 
 
 def check_line_whether_executable(line, line_index, base_format, ignore_part_start, ignore_part_end,
-                                  ignore_line_idx_list):
+                                  ignore_line_idx_list, line_summary=None):
     for part_start, part_end in zip(ignore_part_start, ignore_part_end):
         if int(part_start) <= line_index <= int(part_end):
             return False
 
     if line == '':
-        logger.warning(base_format + '[Ignore null content line: %s] %s' % (line_index, line))
+        if line_summary is None:
+            logger.warning(base_format + '[Ignore null content line: %s] %s' % (line_index, line))
+        else:
+            line_summary.add('Ignore null content line', line_index, line)
         ignore_line_idx_list.append(line_index)
         return False
 
-    sql_type = line.strip()[:7].strip().upper()
-    if sql_type not in ['INSERT', 'UPDATE', 'DELETE', 'REPLACE']:
-        logger.warning(base_format + '[Ignore line: %s] %s' % (line_index, line))
+    sql_type = get_sql_type(line)
+    if sql_type not in DML_TYPES:
+        if line_summary is None:
+            logger.warning(base_format + '[Ignore line: %s] %s' % (line_index, line))
+        else:
+            line_summary.add(f'Ignore line ({line.split(None, 1)[0][:20].upper()})', line_index, line)
         ignore_line_idx_list.append(line_index)
         return False
     return True
@@ -154,18 +208,25 @@ def sort_start(key):
         return key
 
 
-def file_handle(filename, base_format, committed_part, ignore_part_start, ignore_part_end, args):
-    sql_list = []  # SQL 列表：用于保存可执行的 SQL
-    sql_idx_list = []  # SQL 行数列表：用于保存可执行的 SQL 在原文件中的行数，报错时能准确知道错误 SQL 的所在行
-    ignore_line_idx_list = []  # 被跳过的行数列表
-
+def is_file_executed(filename, base_format, committed_part, args):
     if committed_part and not args.stop_never and not args.reset:
-        file_lines = "1-" + str(os.popen("wc -l " + filename + " | awk '{print $1}'").read().strip())
+        file_lines = "1-" + str(count_file_lines(filename))
         if committed_part[0] == file_lines:
             logger.warning(f'File {filename} had been executed all line parts, skip it.')
-            return sql_list, sql_idx_list
+            return True
         else:
             logger.warning(base_format + 'Ignore committed line parts: %s' % committed_part)
+    return False
+
+
+def file_handle(filename, base_format, committed_part, ignore_part_start, ignore_part_end, args,
+                line_summary=None):
+    sql_list = []  # SQL 列表：用于保存可执行的 SQL
+    sql_idx_list = []  # SQL 行数列表：用于保存可执行的 SQL 在原文件中的行数，报错时能准确知道错误 SQL 的所在行
+    ignore_line_idx_list = []  # 被跳过的行数列表
+
+    if is_file_executed(filename, base_format, committed_part, args):
+        return sql_list, sql_idx_list
 
     with open(filename, 'r', encoding='utf8') as fh:
         for idx, line in enumerate(fh):
@@ -173,7 +234,7 @@ def file_handle(filename, base_format, committed_part, ignore_part_start, ignore
             line = line.strip().replace('\n', '')
 
             executable = check_line_whether_executable(
-                line, idx, base_format, ignore_part_start, ignore_part_end, ignore_line_idx_list
+                line, idx, base_format, ignore_part_start, ignore_part_end, ignore_line_idx_list, line_summary
             )
             if not executable:
                 continue
@@ -0,0 +1,144 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import threading
+from pathlib import Path
+from .other_utils import logger
+
+
+class LeaseManager(object):
+    """
+    多个实例（可以在不同主机上，共享 NFS 目录）执行同一个目录时，用租约文件保证一个文件同一时间只被一个实例执行：
+    1. 用 O_CREAT | O_EXCL 原子创建租约文件，创建成功即获得租约，文件内容为持有者；
+    2. 后台线程每隔 timeout / 3 秒更新持有的租约文件的修改时间（心跳）；
+    3. 修改时间超过 timeout 秒的租约视为持有者已崩溃，通过 rename 回收，多个实例同时回收时只有一个 rename 成功；
+    4. 心跳发现租约文件被删除或被其他实例回收时将租约标记为丢失，执行文件的地方应停止执行
+    """
+
+    def __init__(self, lease_dir, timeout=60):
+        self.lease_dir = Path(lease_dir)
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.leases = {}
+        self.lost = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.heartbeat_thread = None
+
+    def get_lease_file(self, sql_file):
+        key = hashlib.sha1(str(Path(sql_file).absolute()).encode()).hexdigest()
+        return self.lease_dir / f'{key}.lease'
+
+    def read_owner(self, lease_file):
+        try:
+            return json.loads(lease_file.read_text()).get('owner')
+        except (OSError, ValueError):
+            return None
+
+    def create_lease_file(self, lease_file, sql_file):
+        try:
+            fd = os.open(lease_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps({'owner': self.owner, 'file': str(sql_file), 'time': time.time()}) + '\n')
+        return True
+
+    def reclaim_stale_lease(self, lease_file):
+        """
+        租约过期时 rename 到唯一的文件名后删除。其他实例可能在判断过期之后已经回收并重新创建了租约，
+        rename 之后文件的持有者与判断过期时不同或者心跳是新的，说明拿到的是活着的租约，放回原处
+        """
+        try:
+            if time.time() - lease_file.stat().st_mtime <= self.timeout:
+                return False
+            stale_owner = self.read_owner(lease_file)
+            stale_file = lease_file.with_name(f'{lease_file.name}.{uuid.uuid4().hex}.stale')
+            os.rename(lease_file, stale_file)
+        except FileNotFoundError:
+            return False
+
+        owner = self.read_owner(stale_file)
+        if owner != stale_owner or time.time() - stale_file.stat().st_mtime <= self.timeout:
+            if lease_file.exists():
+                # 第三个实例在租约被移走期间创建了租约，覆盖它，由它的心跳发现租约丢失后停止执行
+                logger.warning(f'Restore lease of {owner} over the lease of {self.read_owner(lease_file)}: '
+                               f'{lease_file}')
+            os.replace(stale_file, lease_file)
+            return False
+        logger.warning(f'Reclaim stale lease of {owner}: {lease_file}')
+        stale_file.unlink()
+        return True
+
+    def acquire(self, sql_file):
+        """获得租约返回 True，租约被其他实例持有时返回 False"""
+        key = str(sql_file)
+        if key in self.leases:
+            return True
+
+        lease_file = self.get_lease_file(sql_file)
+        acquired = self.create_lease_file(lease_file, sql_file)
+        if not acquired and self.reclaim_stale_lease(lease_file):
+            acquired = self.create_lease_file(lease_file, sql_file)
+        if not acquired:
+            logger.info(f'File {sql_file} is leased by {self.read_owner(lease_file)}, skip it.')
+            return False
+
+        with self.lock:
+            self.leases[key] = lease_file
+            self.lost.discard(key)
+        self.start_heartbeat()
+        return True
+
+    def is_lost(self, sql_file):
+        return str(sql_file) in self.lost
+
+    def release(self, sql_file):
+        with self.lock:
+            lease_file = self.leases.pop(str(sql_file), None)
+            self.lost.discard(str(sql_file))
+        if lease_file is not None and self.read_owner(lease_file) == self.owner:
+            lease_file.unlink(missing_ok=True)
+        return
+
+    def heartbeat(self):
+        with self.lock:
+            leases = list(self.leases.items())
+        for key, lease_file in leases:
+            if self.read_owner(lease_file) != self.owner:
+                logger.error(f'Lease of file {key} is lost: {lease_file}')
+                with self.lock:
+                    self.leases.pop(key, None)
+                    self.lost.add(key)
+                continue
+            os.utime(lease_file)
+        return
+
+    def run_heartbeat(self):
+        while not self.stop_event.wait(self.timeout / 3):
+            try:
+                self.heartbeat()
+            except OSError as e:
+                logger.warning(f'Lease heartbeat failed: {e}')
+        return
+
+    def start_heartbeat(self):
+        if self.heartbeat_thread is None:
+            self.heartbeat_thread = threading.Thread(target=self.run_heartbeat, name='lease-heartbeat', daemon=True)
+            self.heartbeat_thread.start()
+        return
+
+    def close(self):
+        """停止心跳并释放所有租约"""
+        self.stop_event.set()
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+        for key in list(self.leases):
+            self.release(key)
+        return
@@ -0,0 +1,53 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import time
+from .other_utils import logger
+
+
+class LineSummary(object):
+    """
+    按原因聚合被跳过的行和被忽略的错误，每个原因只保留前 sample_size 个行号，
+    每隔 interval 秒输出一次汇总，verbose 为 True 时仍然逐行输出，
+    get_line_name 用于将行号转换成输出的名称（组提交时将组内的位置转换成文件和行号）
+    """
+
+    def __init__(self, base_format, verbose=False, interval=60, sample_size=10, get_line_name=None):
+        self.base_format = base_format
+        self.get_line_name = get_line_name
+        self.verbose = verbose
+        self.interval = interval
+        self.sample_size = sample_size
+        self.counters = {}
+        self.add_times = 0
+        self.changed = False
+        self.last_log_time = time.monotonic()
+
+    def add(self, reason, line_index, detail=''):
+        if self.get_line_name is not None:
+            line_index = self.get_line_name(line_index)
+        counter = self.counters.get(reason)
+        if counter is None:
+            counter = self.counters[reason] = {'count': 0, 'samples': []}
+        counter['count'] += 1
+        if len(counter['samples']) < self.sample_size:
+            counter['samples'].append(line_index)
+        self.changed = True
+
+        if self.verbose:
+            logger.warning(self.base_format + '[%s: %s] %s' % (reason, line_index, detail))
+
+        # 每 1000 次才检查一次时间，避免热点循环中频繁取时间
+        self.add_times += 1
+        if self.add_times % 1000 == 0 and time.monotonic() - self.last_log_time >= self.interval:
+            self.log()
+        return
+
+    def log(self):
+        if self.changed:
+            for reason, counter in sorted(self.counters.items()):
+                samples = ','.join(str(i) for i in counter['samples'])
+                logger.warning(self.base_format + f'[{reason}] [Count: {counter["count"]}] '
+                                                  f'[First lines: {samples}]')
+        self.changed = False
+        self.last_log_time = time.monotonic()
+        return
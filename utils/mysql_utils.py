@@ -1,8 +1,7 @@
 # !/usr/bin/env python3
 # -*- coding:utf8 -*-
-
-# pip3 install mysql-connector-python
-import mysql.connector as cpy
+from .other_utils import logger
+from .session_utils import ACCESS_DENIED_ERRNO, is_variable_applied
 
 
 class MySQLUtils(object):
@@ -10,7 +9,8 @@ class MySQLUtils(object):
             self, host: str = 'localhost', port: int = 3306, socket: str = '',
             user: str = 'root',  password: str = '', database: str = '',
             charset: str = 'utf8mb4',  collation: str = 'utf8mb4_general_ci',
-            autocommit: bool = False, pool_size: int = None
+            autocommit: bool = False, pool_size: int = None, session_variables: dict = None,
+            connector: str = 'auto'
     ):
         if not database:
             raise ValueError('Lack of parameter: database')
@@ -25,6 +25,8 @@ class MySQLUtils(object):
         self.collation = collation
         self.autocommit = autocommit
         self.pool_size = pool_size
+        self.session_variables = session_variables or {}
+        self.connector = connector
 
         self.conn_setting = {
             "host": self.host, "port": self.port, "unix_socket": self.socket,
@@ -37,11 +39,105 @@ class MySQLUtils(object):
 
         self.connection = None
         self.cursor = None
+        self.original_session_variables = {}
+        self.current_session_variables = {}
+        self.session_variable_values = {}
 
     def connect2mysql(self):
         """兼具单连接和连接池功能"""
-        self.connection = cpy.connect(**self.conn_setting)
-        self.cursor = self.connection.cursor(dictionary=True)
+        # pip3 install mysql-connector-python，导入耗时较长，真正连接时才导入
+        import mysql.connector as cpy
+
+        # auto: 有 C 扩展时使用 C 扩展，否则使用纯 Python 实现；cext: 必须使用 C 扩展；pure: 使用纯 Python 实现
+        if self.connector == 'cext' and not cpy.HAVE_CEXT:
+            raise ValueError('C extension of mysql-connector-python is not available')
+        use_pure = self.connector == 'pure' or not cpy.HAVE_CEXT
+        self.connection = cpy.connect(use_pure=use_pure, **self.conn_setting)
+        logger.info(f'MySQL connector: {"pure python" if use_pure else "C extension"}')
+        # 执行 DML 不需要读取结果，使用不缓存结果的元组游标，查询使用 query() 中的字典游标
+        self.cursor = self.connection.cursor()
+        self.original_session_variables = {}
+        self.current_session_variables = {}
+        self.session_variable_values = {}
+        if self.session_variables:
+            self.set_session_variables(self.session_variables)
+        return
+
+    def ping(self):
+        """检查连接是否可用，不自动重连"""
+        if self.connection is None:
+            return False
+        try:
+            self.connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def reconnect(self):
+        """丢弃断开的连接重新连接，并恢复断开前正在使用的会话变量（可能是文件对应的会话变量）"""
+        variables = self.current_session_variables
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+        self.cursor = None
+        self.connect2mysql()
+        self.set_session_variables(variables)
+        return
+
+    def get_session_variable(self, name):
+        return self.query(f'SELECT @@SESSION.{name} AS value')[0]['value']
+
+    def set_session_variables(self, variables: dict):
+        """
+        设置会话变量并查询校验，之前设置过但不在 variables 中的变量恢复原值，
+        没有权限设置的变量（如 sql_log_bin）跳过，其他错误或校验不通过时抛出异常
+        """
+        if variables == self.current_session_variables:
+            return
+        for name in variables:
+            if name not in self.original_session_variables:
+                self.original_session_variables[name] = self.get_session_variable(name)
+                self.session_variable_values[name] = self.original_session_variables[name]
+
+        target_variables = dict(self.original_session_variables)
+        target_variables.update(variables)
+        current_variables = {}
+        for name, value in target_variables.items():
+            if name not in self.original_session_variables:
+                continue
+            if name in variables:
+                current_variables[name] = value
+            if self.session_variable_values[name] == value:
+                continue
+            try:
+                self.execute_sql(f'SET SESSION {name} = %s', (value,))
+            except Exception as e:
+                if getattr(e, 'errno', None) not in ACCESS_DENIED_ERRNO:
+                    raise e
+                logger.warning(f'No privilege to set session variable {name}, skip it. {e}')
+                del self.original_session_variables[name]
+                current_variables.pop(name)
+                continue
+
+            actual = self.get_session_variable(name)
+            if not is_variable_applied(value, actual):
+                raise RuntimeError(f'Session variable {name} is {actual} after set to {value}')
+            self.session_variable_values[name] = value
+        # SELECT 可能开启了事务，结束后才能在下一次切换时设置 sql_log_bin 等变量，
+        # 用 rollback 而不是 commit 结束，不会提交被中断的 chunk 中未提交的修改
+        self.execute_sql('rollback')
+        self.current_session_variables = variables
+        if current_variables:
+            logger.info(f'Session variables: {current_variables}')
+        return
+
+    def restore_session_variables(self):
+        """将设置过的会话变量恢复为连接时的原值"""
+        self.set_session_variables({})
+        self.original_session_variables = {}
+        self.session_variable_values = {}
         return
 
     def execute_sql(self, sql, params: tuple = None):
@@ -58,7 +154,32 @@ class MySQLUtils(object):
         self.cursor.execute(sql, params)
         return
 
+    def query(self, sql, params: tuple = None):
+        """使用独立的字典游标执行查询并返回全部结果，不影响执行 DML 的游标"""
+        if self.connection is None:
+            self.connect2mysql()
+        if params is None:
+            params = tuple()
+
+        cursor = self.connection.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
     def close(self):
+        """先回滚被中断的 chunk 中未提交的修改，再恢复会话变量"""
+        if self.connection is not None:
+            try:
+                self.execute_sql('rollback')
+            except Exception as e:
+                logger.warning(f'Rollback before close failed: {e}')
+        if self.connection is not None and self.original_session_variables:
+            try:
+                self.restore_session_variables()
+            except Exception as e:
+                logger.warning(f'Restore session variables failed: {e}')
         if self.cursor is not None:
             self.cursor.close()
         if self.connection is not None:
@@ -0,0 +1,156 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import json
+import heapq
+import tempfile
+from pathlib import Path
+from .other_utils import logger
+from .sql_utils import parse_dml, integer_value_regex
+
+
+def get_literal_sort_key(value, is_integer):
+    """
+    整数列的整数（包括引号中的整数）按数值排序，其他列只排序字符串常量（去掉引号后按字符串排序，
+    varchar 主键中 '10' 在 '9' 之前），NULL、表达式以及其他形式的常量返回 None
+    """
+    value = value.strip()
+    if is_integer:
+        match = integer_value_regex.match(value)
+        return [0, int(match.group(1))] if match is not None else None
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '\'"':
+        return [1, value[1:-1]]
+    return None
+
+
+class InsertSorter(object):
+    """
+    将连续的 INSERT 按表和主键排序后再执行，减少聚簇索引的页分裂和随机 I/O，只用于标记为与顺序无关的文件或表：
+    1. 只排序单行 INSERT，表有主键、没有触发器和外键，主键的值都是常量；
+    2. 其他语句（UPDATE、DELETE、多行 INSERT、其他表的 INSERT 等）是屏障，之前缓存的 INSERT 先排序输出，
+       屏障语句保持原来的位置，因此 INSERT 不会越过修改同一行的语句；
+    3. 缓存的 INSERT 达到 window 条时排序输出，超过 buffer_size 条时将已排序的部分写入临时文件，最后归并；
+    4. 每条语句都带着原来的行号，已提交的行号和不排序时一样按行记录
+    """
+
+    def __init__(self, table_meta, chunk, tables=None, file_regex='', window=100000, buffer_size=100000):
+        self.table_meta = table_meta
+        self.chunk = chunk
+        self.tables = {table_meta.get_table_key(table) for table in tables or [] if table != '*'}
+        self.all_tables = '*' in (tables or [])
+        self.file_regex = file_regex
+        self.window = window
+        self.buffer_size = buffer_size
+
+    def is_file_enabled(self, sql_file):
+        """文件名匹配 file_regex 时文件中所有表的 INSERT 都排序"""
+        return bool(self.file_regex and Path(sql_file).match(self.file_regex))
+
+    def is_enabled(self, sql_file):
+        return bool(self.tables or self.all_tables or self.is_file_enabled(sql_file))
+
+    def get_sort_key(self, sql, all_tables):
+        """返回 [表, 主键值...]，不能排序的语句返回 None"""
+        statement = parse_dml(sql)
+        if statement is None or statement['type'] != 'INSERT':
+            return None
+        table = self.table_meta.get_table_key(statement['table'])
+        if not all_tables and table not in self.tables:
+            return None
+        meta = self.table_meta.get(statement['table'])
+        if meta is None or not meta['pk'] or meta['has_trigger'] or meta['has_foreign_key']:
+            return None
+
+        sort_key = [table]
+        for column in meta['pk']:
+            if column not in statement['values']:
+                return None
+            value_key = get_literal_sort_key(statement['values'][column], column in meta['integer_columns'])
+            if value_key is None:
+                return None
+            sort_key.append(value_key)
+        return sort_key
+
+    def spill(self, records, runs):
+        records.sort(key=lambda record: (record[0], record[1]))
+        run_file = tempfile.TemporaryFile(mode='w+', encoding='utf8')
+        for record in records:
+            run_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        run_file.seek(0)
+        runs.append(run_file)
+        return
+
+    def iter_sorted(self, records, runs):
+        """内存中的记录和临时文件中已排序的记录归并，按 (排序键, 行号) 输出"""
+        records.sort(key=lambda record: (record[0], record[1]))
+        if not runs:
+            yield from records
+            return
+        logger.info(f'Merge {len(runs)} sorted runs of INSERT statements from temporary files')
+        try:
+            yield from heapq.merge(
+                records, *[(json.loads(line) for line in run_file) for run_file in runs],
+                key=lambda record: (record[0], record[1])
+            )
+        finally:
+            for run_file in runs:
+                run_file.close()
+
+    def sort_chunks(self, sql_parts, sql_file):
+        """
+        sql_parts 为 file_handle 的输出，重新分成每 chunk 条语句一组输出，
+        最后输出 file_handle 最后一次输出的被跳过的行号
+        """
+        all_tables = self.all_tables or self.is_file_enabled(sql_file)
+        records = []
+        runs = []
+        window_count = 0
+        sql_list = []
+        sql_idx_list = []
+
+        def pop_chunk():
+            chunk = sql_list[:self.chunk], sql_idx_list[:self.chunk]
+            del sql_list[:self.chunk], sql_idx_list[:self.chunk]
+            return chunk
+
+        def flush_window():
+            """排序输出缓存的 INSERT，边归并边输出，不会把整个窗口读入内存"""
+            nonlocal records, runs, window_count
+            for _, sql_idx, sql in self.iter_sorted(records, runs):
+                sql_list.append(sql)
+                sql_idx_list.append(sql_idx)
+                if len(sql_list) >= self.chunk:
+                    yield pop_chunk()
+            records = []
+            runs = []
+            window_count = 0
+
+        for part_sql_list, part_idx_list in sql_parts:
+            if not part_sql_list:
+                yield from flush_window()
+                while sql_list:
+                    yield pop_chunk()
+                yield part_sql_list, part_idx_list
+                continue
+
+            for sql, sql_idx in zip(part_sql_list, part_idx_list):
+                sort_key = self.get_sort_key(sql, all_tables)
+                if sort_key is None:
+                    yield from flush_window()
+                    sql_list.append(sql)
+                    sql_idx_list.append(sql_idx)
+                else:
+                    records.append([sort_key, sql_idx, sql])
+                    window_count += 1
+                    if window_count >= self.window:
+                        yield from flush_window()
+                    elif len(records) >= self.buffer_size:
+                        self.spill(records, runs)
+                        records = []
+
+                if len(sql_list) >= self.chunk:
+                    yield pop_chunk()
+
+        # file_handle 没有输出最后的被跳过行号时，也要输出剩余的语句
+        yield from flush_window()
+        while sql_list:
+            yield pop_chunk()
@@ -1,26 +1,29 @@
 # !/usr/bin/env python3
 # -*- coding:utf8 -*-
 import sys
-import pendulum
+import time
+from datetime import timedelta
 from loguru import logger
 from pathlib import Path
 
 py_file_path = Path(sys.argv[0])
 py_file_pre = py_file_path.parts[-1].replace('.py', '')
 log_file = py_file_path.parent / 'logs' / f'{py_file_pre}.log'
-log_file.parent.mkdir(exist_ok=True, parents=True)
-logger.add(log_file, rotation='100MB', colorize=True, retention=10, compression='zip', enqueue=True)
+
+
+def add_log_file_sink():
+    """延迟到确定有任务需要执行时才添加日志文件，无任务时可以尽快退出"""
+    log_file.parent.mkdir(exist_ok=True, parents=True)
+    logger.add(log_file, rotation='100MB', colorize=True, retention=10, compression='zip', enqueue=True)
+    return
 
 
 def ts_now() -> int:
-    return int(pendulum.now().timestamp())
+    return int(time.time())
 
 
 def ts_interval(ts1: int = 0, ts2: int = 0):
-    ts1 = pendulum.from_timestamp(ts1)
-    ts2 = pendulum.from_timestamp(ts2)
-    result = pendulum.interval(ts1, ts2, absolute=True).as_duration()
-    return result
+    return timedelta(seconds=abs(ts1 - ts2))
 
 
 def get_log_format(args, sql_file):
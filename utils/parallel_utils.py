@@ -0,0 +1,134 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import io
+from array import array
+from bisect import bisect_right
+from collections import deque
+from pathlib import Path
+from .file_utils import is_file_executed
+from .sql_utils import DML_TYPES, get_sql_type
+
+
+def split_file_blocks(filename, block_size):
+    """按 block_size 将文件切分成若干块，每块的结束位置对齐到换行符之后，返回 [(start, end), ...]"""
+    file_size = Path(filename).stat().st_size
+    blocks = []
+    start = 0
+    with open(filename, 'rb') as f:
+        while start < file_size:
+            end = start + block_size
+            if end < file_size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            else:
+                end = file_size
+            blocks.append((start, end))
+            start = end
+    return blocks
+
+
+def classify_block(filename, start, end, keep_ignored_line=False):
+    """
+    在子进程中对文件块中的行进行分类和去除首尾空白，行号从 1 开始，相对于文件块。
+    与 file_handle 一样按文本模式的通用换行符（LF、CR、CRLF）分行，用 str.strip() 去除空白（包括 Unicode 空白），
+    文件块的边界在 LF 之后，不会拆开 CRLF。为了减少进程间传输的数据量，返回值只包含 bytes：
+    (行数, 可执行 SQL 用换行符连接, 可执行 SQL 行号 array, {跳过原因: 行号 array}, 被跳过的行用换行符连接)
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    lines = list(io.StringIO(data.decode('utf8'), newline=None))
+
+    sql_list = []
+    sql_idx_list = array('I')
+    ignored = {}
+    ignored_line_list = []
+    for idx, line in enumerate(lines, 1):
+        line = line.strip()
+        if line == '':
+            reason = 'Ignore null content line'
+        elif get_sql_type(line) not in DML_TYPES:
+            reason = f'Ignore line ({line.split(None, 1)[0][:20].upper()})'
+        else:
+            sql_list.append(line)
+            sql_idx_list.append(idx)
+            continue
+
+        ignored.setdefault(reason, array('I')).append(idx)
+        if keep_ignored_line:
+            ignored_line_list.append(line)
+
+    return (
+        len(lines), '\n'.join(sql_list).encode('utf8'), sql_idx_list.tobytes(),
+        {reason: idx_list.tobytes() for reason, idx_list in ignored.items()},
+        '\n'.join(ignored_line_list).encode('utf8')
+    )
+
+
+def iter_classified_blocks(executor, filename, block_size, keep_ignored_line, workers):
+    """最多同时提交 workers * 2 个文件块，按文件顺序返回结果，避免大文件的解析结果全部堆积在内存中"""
+    futures = deque()
+    for start, end in split_file_blocks(filename, block_size):
+        futures.append(executor.submit(classify_block, filename, start, end, keep_ignored_line))
+        if len(futures) >= workers * 2:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def parallel_file_handle(executor, filename, base_format, committed_part, ignore_part_start, ignore_part_end,
+                         args, line_summary=None):
+    """与 file_handle 的返回结果一致，分类和去除空白在进程池中并行完成，主进程只负责按顺序组装 chunk"""
+    sql_list = []
+    sql_idx_list = []
+    ignore_line_idx_list = []
+
+    if is_file_executed(filename, base_format, committed_part, args):
+        return sql_list, sql_idx_list
+
+    ignore_parts = sorted(zip((int(i) for i in ignore_part_start), (int(i) for i in ignore_part_end)))
+    ignore_starts = [part[0] for part in ignore_parts]
+
+    def is_committed(line_index):
+        i = bisect_right(ignore_starts, line_index) - 1
+        return i >= 0 and line_index <= ignore_parts[i][1]
+
+    keep_ignored_line = line_summary is not None and line_summary.verbose
+    base_idx = 0
+    for line_count, block_sql, block_sql_idx, block_ignored, block_ignored_line in iter_classified_blocks(
+            executor, filename, args.parse_block_size * 1024 * 1024, keep_ignored_line, args.parse_workers
+    ):
+        ignored_line_list = block_ignored_line.decode('utf8').split('\n') if keep_ignored_line else []
+        ignored = sorted(
+            (base_idx + idx, reason) for reason, idx_list in block_ignored.items()
+            for idx in array('I', idx_list)
+        )
+        for i, (idx, reason) in enumerate(ignored):
+            if ignore_parts and is_committed(idx):
+                continue
+            ignore_line_idx_list.append(idx)
+            if line_summary is not None:
+                line_summary.add(reason, idx, ignored_line_list[i] if keep_ignored_line else '')
+
+        block_sql_list = block_sql.decode('utf8').split('\n') if block_sql else []
+        for line, idx in zip(block_sql_list, array('I', block_sql_idx)):
+            idx = base_idx + idx
+            if ignore_parts and is_committed(idx):
+                continue
+
+            sql_list.append(line)
+            sql_idx_list.append(idx)
+
+            if idx % args.chunk == 0:
+                yield sql_list, sql_idx_list
+                sql_list = []
+                sql_idx_list = []
+        base_idx += line_count
+
+    if sql_list:
+        yield sql_list, sql_idx_list
+        sql_list = []
+
+    yield sql_list, ignore_line_idx_list
@@ -5,6 +5,8 @@ import configargparse
 import sys
 from pathlib import Path
 from .other_utils import logger, py_file_path, py_file_pre
+from .session_utils import load_session_profile
+from .file_utils import is_stream_source
 
 
 def parse_args():
@@ -14,7 +16,8 @@ def parse_args():
         description='Parse Args', add_help=False,
         formatter_class=configargparse.ArgumentDefaultsHelpFormatter,
         config_file_parser_class=configargparse.YAMLConfigFileParser,
-        default_config_files=['conf.d/*.yaml'],  # 可以设置更多路径
+        # 可以设置更多路径，目录不存在时不设置，减少启动耗时
+        default_config_files=['conf.d/*.yaml'] if Path('conf.d').is_dir() else [],
     )
     parser.add_argument('--help', dest='help', action='store_true',
                         help='help information', default=False)
@@ -37,6 +40,20 @@ def parse_args():
                                  help='MySQL Charset')
     connect_setting.add_argument('--collation', dest='collation', type=str, default='utf8mb4_general_ci',
                                  help='MySQL collation')
+    connect_setting.add_argument('--connector', dest='connector', type=str, default='auto',
+                                 choices=['auto', 'cext', 'pure'],
+                                 help='Protocol implementation of mysql-connector-python, auto: C extension if '
+                                      'available else pure python; cext: C extension only; pure: pure python.')
+    connect_setting.add_argument('--session-profile', dest='session_profile', type=str, default='',
+                                 help='JSON file of session variables set after connect and restored before close, '
+                                      'e.g. {"default": {"unique_checks": 0}, '
+                                      '"files": {"*_big.sql": {"foreign_key_checks": 0}}}, '
+                                      'variables under "files" apply to the first matched file name pattern.')
+    connect_setting.add_argument('--session-var', dest='session_var', type=str, action='append', default=[],
+                                 help='Session variable set after connect, override default variables of '
+                                      '--session-profile, format: name=value, can be used multiple times. '
+                                      'e.g. --session-var unique_checks=0 '
+                                      '--session-var transaction_isolation=READ-COMMITTED')
 
     schema = parser.add_argument_group('schema filter')
     schema.add_argument('-d', '--database', dest='database', type=str, default='',
@@ -44,7 +61,8 @@ def parse_args():
 
     sql_file = parser.add_argument_group('sql file')
     sql_file.add_argument('-f', '--file', dest='file_path', type=str, nargs='*', default='',
-                          help='SQL file you want to execute')
+                          help='SQL file you want to execute, - means read SQL from stdin, a named pipe (FIFO) '
+                               'is also read as a stream. A stream must be the only file.')
     sql_file.add_argument('-fd', '--file-dir', dest='file_dir', type=str, default='.',
                           help='SQL file dir')
     sql_file.add_argument('-fr', '--file-regex', dest='file_regex', type=str, default='*.sql',
@@ -64,6 +82,26 @@ def parse_args():
     committed_file = py_file_path.parent / 'logs' / f'committed_{py_file_pre}.json'
     sql_file.add_argument('--save', dest='result_file', type=str, default=committed_file,
                           help='file for save committed parts.')
+    sql_file.add_argument('--progress-table', dest='progress_table', type=str, default='',
+                          help='Save committed parts into this table of target database (created if not exists) '
+                               'in the same transaction as the chunk, instead of the result file. '
+                               'Format: table or db.table')
+    sql_file.add_argument('--stream-buffer', dest='stream_buffer', type=int, default=10000,
+                          help='Max number of lines read ahead from stdin or named pipe, the writer is blocked '
+                               'when the buffer is full.')
+    sql_file.add_argument('--stream-flush-timeout', dest='stream_flush_timeout', type=float, default=1,
+                          help='Execute the lines read from stdin or named pipe when no new line arrives within '
+                               'this seconds, even if less than --chunk lines.')
+    sql_file.add_argument('--stream-resume', dest='stream_resume', action='store_true', default=False,
+                          help='Skip the lines committed by the last interrupted run of stdin or named pipe, use it '
+                               'only when the writer replays the same stream from the beginning. Without it every '
+                               'run of a stream starts from line 1. The record is cleared when the stream ends.')
+    sql_file.add_argument('--lease-dir', dest='lease_dir', type=str, default='',
+                          help='Directory of lease files (e.g. on NFS shared by all hosts), a file is executed only '
+                               'by the instance holding its lease, so multiple instances can execute the same '
+                               'file dir. They should share the same --save file or --progress-table.')
+    sql_file.add_argument('--lease-timeout', dest='lease_timeout', type=float, default=60,
+                          help='Lease whose heartbeat is older than this seconds is reclaimed by other instances.')
 
     execute = parser.add_argument_group('execute method')
     execute.add_argument('--chunk', dest='chunk', type=int, default=2000,
@@ -77,6 +115,94 @@ def parse_args():
     execute.add_argument('--save-per-commit', dest='save_per_commit', action='store_true', default=False,
                          help='Once commit one part, save it into result file. '
                               'If set to True, the execute time will be much longer.')
+    execute.add_argument('--retry-times', dest='retry_times', type=int, default=3,
+                         help='Retry times of chunk when transient error (deadlock, lock wait timeout, '
+                              'too many connections) occurs, 0 means do not retry.')
+    execute.add_argument('--retry-interval', dest='retry_interval', type=float, default=1,
+                         help='Sleep time before first retry, it doubles every retry (max 60 seconds).')
+    execute.add_argument('--reconnect-times', dest='reconnect_times', type=int, default=10,
+                         help='Reconnect times when connection is lost (server restart, failover, wait_timeout), '
+                              'then re-execute the uncommitted chunk, 0 means exit when connection is lost.')
+    execute.add_argument('--reconnect-interval', dest='reconnect_interval', type=float, default=1,
+                         help='Sleep time before first reconnect, it doubles every reconnect (max 60 seconds).')
+    execute.add_argument('--bisect-error', dest='bisect_error', action='store_true', default=False,
+                         help='When permanent error occurs, split the failed chunk and commit the good lines, '
+                              'only the error lines are saved into reject file instead of exit.')
+    reject_file = py_file_path.parent / 'logs' / f'rejected_{py_file_pre}.txt'
+    execute.add_argument('--reject-file', dest='reject_file', type=str, default=reject_file,
+                         help='file for save rejected lines when use --bisect-error options.')
+
+    execute.add_argument('--group-commit-max-size', dest='group_commit_max_size', type=int, default=0,
+                         help='Files not bigger than this size (KB) are packed into one transaction until '
+                              '--chunk statements, committed once and saved into result file once. '
+                              '0 means disable group commit.')
+    execute.add_argument('--eliminate-redundant', dest='eliminate_redundant', action='store_true', default=False,
+                         help='Eliminate redundant statements on the same primary key in a chunk before executing: '
+                              'UPDATEs overwritten by a later full-row UPDATE, INSERT followed by DELETE. '
+                              'Only for tables with primary key and without trigger or foreign key, '
+                              'the original chunk is re-executed if the reduced chunk fails. '
+                              'Disabled when --skip-error-regex is set.')
+    execute.add_argument('--sort-insert-tables', dest='sort_insert_tables', type=str, default='',
+                         help='Tables whose INSERT order does not matter, comma separated, * means all tables. '
+                              'Consecutive single row INSERTs of these tables are sorted by primary key before '
+                              'executing, for better locality of clustered index.')
+    execute.add_argument('--sort-insert-file-regex', dest='sort_insert_file_regex', type=str, default='',
+                         help='Files whose INSERT order does not matter, INSERTs of all tables in these files '
+                              'are sorted by primary key.')
+    execute.add_argument('--sort-insert-window', dest='sort_insert_window', type=int, default=100000,
+                         help='Max number of INSERTs sorted together.')
+    execute.add_argument('--sort-insert-buffer', dest='sort_insert_buffer', type=int, default=100000,
+                         help='Max number of INSERTs kept in memory when sorting, the rest are sorted in runs '
+                              'spilled into temporary files and merged.')
+    execute.add_argument('--parse-workers', dest='parse_workers', type=int, default=0,
+                         help='Number of processes to classify and strip SQL lines in parallel, '
+                              '0 means parse in the main process.')
+    execute.add_argument('--parse-block-size', dest='parse_block_size', type=int, default=8,
+                         help='Size (MB) of file block parsed by one process each time.')
+    execute.add_argument('--statement-stats', dest='statement_stats', action='store_true', default=False,
+                         help='Aggregate count, execute time and affected rows per SQL fingerprint, report top N '
+                              'fingerprints of the file at the end of every file, and of all files after the '
+                              'current chunk when receive SIGUSR1.')
+    execute.add_argument('--statement-stats-top', dest='statement_stats_top', type=int, default=10,
+                         help='Number of fingerprints in statement stats report.')
+
+    execute.add_argument('--log-ignored-lines', dest='log_ignored_lines', action='store_true', default=False,
+                         help='Log every ignored line and skipped error, by default only summary of them are logged.')
+    execute.add_argument('--log-summary-interval', dest='log_summary_interval', type=int, default=60,
+                         help='Log summary of ignored lines and skipped errors every specify seconds.')
+
+    rate_limit = parser.add_argument_group('rate limit')
+    rate_limit.add_argument('--rate-limit', dest='rate_limit', type=float, default=0,
+                            help='Max number of statements or affected rows per second, 0 means no limit. '
+                                 'Shared by all threads of this process.')
+    rate_limit.add_argument('--rate-limit-unit', dest='rate_limit_unit', type=str, default='statements',
+                            choices=['statements', 'rows'], help='Unit of rate limit.')
+    rate_limit.add_argument('--rate-limit-file', dest='rate_limit_file', type=str, default='',
+                            help='Share the rate limit with other processes on the same host which use the same '
+                                 'file, e.g. /tmp/execute_mysql_dml_3306.bucket')
+
+    preflight = parser.add_argument_group('preflight check')
+    preflight.add_argument('--preflight', dest='preflight', type=str, choices=['report', 'refuse'], default=None,
+                           help='EXPLAIN samples of every distinct SQL template before execute, data will not be '
+                                'modified. report: only print the report and exit. refuse: print the report and '
+                                'refuse to execute if any template is full table scan or scans too many rows.')
+    preflight.add_argument('--preflight-samples', dest='preflight_samples', type=int, default=3,
+                           help='Number of sample SQL to EXPLAIN per template.')
+    preflight.add_argument('--preflight-max-rows', dest='preflight_max_rows', type=int, default=10000,
+                           help='Template whose estimated examined rows is more than this value will be flagged.')
+
+    profile = parser.add_argument_group('profile')
+    profile.add_argument('--profile', dest='profile', action='store_true', default=False,
+                         help='Record count, wall time and CPU time of each stage (parse, execute, commit, '
+                              'save_progress, sleep) and save a JSON report at the end.')
+    profile_report = py_file_path.parent / 'logs' / f'profile_{py_file_pre}.json'
+    profile.add_argument('--profile-report', dest='profile_report', type=str, default=profile_report,
+                         help='File for save profile report, cProfile stats are saved into the .prof file '
+                              'with the same name.')
+    profile.add_argument('--profile-cprofile', dest='profile_cprofile', action='store_true', default=False,
+                         help='Also profile functions with cProfile when use --profile options (slower).')
+    profile.add_argument('--profile-tracemalloc', dest='profile_tracemalloc', action='store_true', default=False,
+                         help='Also trace memory allocations with tracemalloc when use --profile options (slower).')
 
     action = parser.add_argument_group('action method')
     action.add_argument('--stop-never', dest='stop_never', action='store_true', default=False,
@@ -84,6 +210,18 @@ def parse_args():
     action.add_argument('--sleep', dest='sleep', type=int, default=60,
                         help='When you use stop never options, we will sleep specify seconds after '
                              'finished every time.')
+    action.add_argument('--schedule-policy', dest='schedule_policy', type=str, default='name',
+                        choices=['name', 'oldest', 'smallest', 'weight'],
+                        help='Order of executing files. name: file name; oldest: oldest modification time first; '
+                             'smallest: smallest file first; weight: file in dir with bigger --dir-weight first.')
+    action.add_argument('--dir-weight', dest='dir_weight', type=str, nargs='*', default=[],
+                        help='Weight of file dir for weight schedule policy, format: dir=weight, default weight is 1.')
+    action.add_argument('--slice-chunks', dest='slice_chunks', type=int, default=0,
+                        help='Switch to other waiting files after executed number of chunks of a file, '
+                             'so small files do not wait for big file. 0 means execute whole file at once.')
+    action.add_argument('--rescan-interval', dest='rescan_interval', type=int, default=10,
+                        help='When you use stop never options, scan new files every specify seconds '
+                             'while executing files, they will be executed after current slice.')
     action.add_argument('--delete-file', dest='delete_executed_file', action='store_true', default=False,
                         help='Delete SQL file after executed successfully')
     action.add_argument('--delete-record', dest='delete_not_exists_file_record', action='store_true',
@@ -108,15 +246,66 @@ def parse_args_from_command_line(args: configargparse):
 
     if args.file_path:
         for f in args.file_path:
-            if not Path(f).exists():
+            if f != '-' and not Path(f).exists():
                 logger.error(f'File {f} does not exists.')
                 sys.exit(1)
+        if len(args.file_path) > 1 and any(is_stream_source(f) for f in args.file_path):
+            logger.error(f'Stdin or named pipe must be the only file.')
+            sys.exit(1)
+
+    if args.stream_buffer <= 0 or args.stream_flush_timeout <= 0:
+        logger.error(f'Invalid value of stream buffer or stream flush timeout')
+        sys.exit(1)
 
     if args.file_dir and not Path(args.file_dir).is_dir():
         logger.error(f'File dir {args.file_dir} does not exists.')
         sys.exit(1)
 
+    try:
+        args.session_variables, args.file_session_variables = load_session_profile(
+            args.session_profile, args.session_var
+        )
+    except (ValueError, OSError) as e:
+        logger.error(f'Invalid session profile: {e}')
+        sys.exit(1)
+
+    if args.rate_limit < 0:
+        logger.error(f'Invalid value of rate limit')
+        sys.exit(1)
+
     if args.sleep < 0:
         logger.error(f'Invalid value of sleep')
         sys.exit(1)
+
+    if args.preflight and args.preflight_samples <= 0:
+        logger.error(f'Invalid value of preflight samples')
+        sys.exit(1)
+
+    if args.parse_workers < 0 or args.parse_block_size <= 0:
+        logger.error(f'Invalid value of parse workers or parse block size')
+        sys.exit(1)
+
+    if args.group_commit_max_size < 0:
+        logger.error(f'Invalid value of group commit max size')
+        sys.exit(1)
+
+    if args.slice_chunks < 0 or args.rescan_interval < 0:
+        logger.error(f'Invalid value of slice chunks or rescan interval')
+        sys.exit(1)
+
+    if args.sort_insert_window <= 0 or args.sort_insert_buffer <= 0:
+        logger.error(f'Invalid value of sort insert window or sort insert buffer')
+        sys.exit(1)
+
+    if args.lease_timeout <= 0:
+        logger.error(f'Invalid value of lease timeout')
+        sys.exit(1)
+
+    if args.retry_times < 0 or args.retry_interval < 0:
+        logger.error(f'Invalid value of retry times or retry interval')
+        sys.exit(1)
+
+    if args.reconnect_times < 0 or args.reconnect_interval < 0:
+        logger.error(f'Invalid value of reconnect times or reconnect interval')
+        sys.exit(1)
     return args
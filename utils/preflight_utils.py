@@ -0,0 +1,117 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import time
+from .file_utils import get_file_executed_record, is_stream_key
+from .other_utils import logger
+from .sql_utils import is_dml, get_sql_fingerprint
+
+# 估算执行时间时假设的扫描速度（行/秒）
+SCAN_ROWS_PER_SECOND = 1000000
+
+
+def collect_sql_templates(args, sql_file_list, progress_store=None):
+    """
+    按指纹归类所有未提交的 SQL，每个模板保留前 preflight_samples 条不同的 SQL 作为样本，
+    标准输入和命名管道只能读取一次，预检查会消耗掉流中的数据，跳过
+    """
+    templates = {}
+    for sql_file in sql_file_list:
+        if is_stream_key(sql_file):
+            logger.warning(f'[Preflight] Skip stream: {sql_file}')
+            continue
+        if progress_store is None:
+            committed_part, committed_part_start, committed_part_end = get_file_executed_record(args, sql_file)
+        else:
+            committed_part, committed_part_start, committed_part_end = progress_store.get_file_executed_record(
+                args, sql_file
+            )
+        committed_ranges = [(int(start), int(end)) for start, end in zip(committed_part_start, committed_part_end)]
+        with open(sql_file, 'r', encoding='utf8') as fh:
+            for idx, line in enumerate(fh, 1):
+                line = line.strip()
+                if not is_dml(line):
+                    continue
+                if any(start <= idx <= end for start, end in committed_ranges):
+                    continue
+
+                fingerprint = get_sql_fingerprint(line)
+                template = templates.get(fingerprint)
+                if template is None:
+                    template = templates[fingerprint] = {
+                        'count': 0, 'samples': []
+                    }
+                template['count'] += 1
+                if len(template['samples']) < args.preflight_samples and line not in template['samples']:
+                    template['samples'].append(line)
+    return templates
+
+
+def explain_template(mysql_obj, template):
+    """对模板的样本执行 EXPLAIN，统计扫描类型、预估行数和平均往返耗时，EXPLAIN 不会修改数据"""
+    full_scan = False
+    estimated_rows = []
+    access_types = set()
+    used_time = 0
+    for sql in template['samples']:
+        ts_start = time.perf_counter()
+        rows = mysql_obj.query('EXPLAIN ' + sql)
+        used_time += time.perf_counter() - ts_start
+
+        sample_rows = 0
+        for row in rows:
+            # INSERT/REPLACE ... VALUES 的 EXPLAIN 结果 type 也是 ALL，但不会扫描表
+            if row.get('select_type') in ('INSERT', 'REPLACE'):
+                continue
+            access_types.add(f"{row.get('table')}:{row.get('type')}:{row.get('key')}")
+            if row.get('type') == 'ALL':
+                full_scan = True
+            sample_rows = max(sample_rows, int(row.get('rows') or 0))
+        estimated_rows.append(sample_rows)
+
+    template['full_scan'] = full_scan
+    template['access_types'] = sorted(access_types)
+    template['estimated_rows'] = int(sum(estimated_rows) / len(estimated_rows))
+    template['latency'] = used_time / len(template['samples'])
+    template['estimated_time'] = template['count'] * (
+            template['latency'] + template['estimated_rows'] / SCAN_ROWS_PER_SECOND
+    )
+    return template
+
+
+def preflight_check(args, mysql_obj, sql_file_list, progress_store=None):
+    """
+    执行前检查：按指纹抽样 EXPLAIN，报告全表扫描或预估扫描行数过多的模板并估算总执行时间，
+    返回有问题的模板列表
+    """
+    templates = collect_sql_templates(args, sql_file_list, progress_store)
+    logger.info(f'[Preflight] Total templates: {len(templates)}, '
+                f'total statements: {sum(t["count"] for t in templates.values())}')
+
+    flagged_templates = []
+    for fingerprint, template in templates.items():
+        try:
+            explain_template(mysql_obj, template)
+        except Exception as e:
+            logger.error(f'[Preflight] [Explain failed] {fingerprint} [Sample: {template["samples"][0]}] {e}')
+            template.update(full_scan=False, access_types=[], estimated_rows=0, latency=0, estimated_time=0,
+                            error=str(e))
+            flagged_templates.append(fingerprint)
+            continue
+
+        if template['full_scan'] or template['estimated_rows'] > args.preflight_max_rows:
+            flagged_templates.append(fingerprint)
+
+    total_time = 0
+    for fingerprint, template in sorted(templates.items(), key=lambda x: x[1]['estimated_time'], reverse=True):
+        total_time += template['estimated_time']
+        msg = (f'[Preflight] [Count: {template["count"]}] [Estimated rows: {template["estimated_rows"]}] '
+               f'[Access: {",".join(template["access_types"])}] '
+               f'[Estimated time: {template["estimated_time"]:.1f}s] {fingerprint}')
+        if fingerprint in flagged_templates:
+            reason = 'EXPLAIN FAILED' if template.get('error') else \
+                'FULL TABLE SCAN' if template['full_scan'] else 'TOO MANY ROWS'
+            logger.warning(msg + f' [{reason}] [Sample: {template["samples"][0]}]')
+        else:
+            logger.info(msg)
+    logger.info(f'[Preflight] Estimated total time: {total_time:.1f}s, flagged templates: {len(flagged_templates)}')
+    return flagged_templates
@@ -0,0 +1,143 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import io
+import json
+import time
+from pathlib import Path
+from contextlib import contextmanager
+from .other_utils import logger
+
+PROFILE_TOP = 20
+
+
+class StageProfiler(object):
+    """
+    按执行阶段累计次数、墙上时间和 CPU 时间（当前线程），未启用时 stage() 不计时：
+    parse: 读取并分类文件中的行（file_handle / parallel_file_handle）；execute: 执行 SQL；
+    commit: 记录进度表并提交；save_progress: 保存结果文件或进度表；sleep: --interval 和限速等待。
+    可选用 cProfile 采集函数耗时、用 tracemalloc 采集内存分配，结束时写入 JSON 报告
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.profiler = None
+        self.tracemalloc = None
+        self.ts_start = 0
+        self.cpu_start = 0
+
+    def start(self, use_cprofile=False, use_tracemalloc=False):
+        self.enabled = True
+        self.ts_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        if use_tracemalloc:
+            import tracemalloc
+
+            self.tracemalloc = tracemalloc
+            tracemalloc.start()
+        if use_cprofile:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        ts_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            stat = self.stages.get(name)
+            if stat is None:
+                stat = self.stages[name] = {'count': 0, 'wall': 0, 'cpu': 0}
+            stat['count'] += 1
+            stat['wall'] += time.perf_counter() - ts_start
+            stat['cpu'] += time.thread_time() - cpu_start
+
+    def iter_stage(self, name, iterable):
+        """每次从 iterable 取下一个元素的耗时计入 name 阶段"""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        try:
+            while True:
+                with self.stage(name):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    def get_cprofile_report(self, report_file):
+        import pstats
+
+        self.profiler.disable()
+        self.profiler.dump_stats(Path(report_file).with_suffix('.prof'))
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        functions = []
+        for (filename, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+            functions.append({
+                'function': f'{filename}:{line}({function})', 'ncalls': ncalls,
+                'tottime': round(tottime, 6), 'cumtime': round(cumtime, 6)
+            })
+        functions.sort(key=lambda x: x['cumtime'], reverse=True)
+        return functions[:PROFILE_TOP]
+
+    def get_tracemalloc_report(self):
+        snapshot = self.tracemalloc.take_snapshot()
+        current, peak = self.tracemalloc.get_traced_memory()
+        self.tracemalloc.stop()
+        return {
+            'current': current, 'peak': peak,
+            'top': [
+                {'location': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:PROFILE_TOP]
+            ]
+        }
+
+    def report(self, report_file):
+        """写入 JSON 报告并打印各阶段耗时"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        total_wall = time.perf_counter() - self.ts_start
+        total_cpu = time.thread_time() - self.cpu_start
+        stages = {}
+        for name, stat in sorted(self.stages.items(), key=lambda x: x[1]['wall'], reverse=True):
+            stages[name] = {
+                'count': stat['count'], 'wall': round(stat['wall'], 6), 'cpu': round(stat['cpu'], 6),
+                'wall_percent': round(stat['wall'] / total_wall * 100, 2) if total_wall else 0
+            }
+            logger.info(f'[Profile] [{name}] [count: {stat["count"]}] [wall: {stat["wall"]:.3f}s] '
+                        f'[cpu: {stat["cpu"]:.3f}s] [{stages[name]["wall_percent"]}%]')
+        other_wall = total_wall - sum(stat['wall'] for stat in self.stages.values())
+        logger.info(f'[Profile] [total wall: {total_wall:.3f}s] [total cpu: {total_cpu:.3f}s] '
+                    f'[other: {other_wall:.3f}s]')
+
+        profile_report = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'total_wall': round(total_wall, 6), 'total_cpu': round(total_cpu, 6),
+            'other_wall': round(other_wall, 6), 'stages': stages
+        }
+        if self.profiler is not None:
+            profile_report['cprofile'] = self.get_cprofile_report(report_file)
+        if self.tracemalloc is not None:
+            profile_report['tracemalloc'] = self.get_tracemalloc_report()
+
+        Path(report_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(report_file, 'w', encoding='utf8') as f:
+            f.write(json.dumps(profile_report, ensure_ascii=False, indent=4) + '\n')
+        logger.info(f'[Profile] Report saved to {report_file}')
+        return
+
+
+stage_profiler = StageProfiler()
@@ -0,0 +1,118 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import re
+import hashlib
+from pathlib import Path
+from .file_utils import modify_idx_record_list, sort_start, get_file_record_part_start_end, is_stream_key
+from .other_utils import logger
+
+table_name_regex = re.compile(r'^(?:\w+\.)?\w+$')
+
+CREATE_TABLE_SQL = """CREATE TABLE IF NOT EXISTS {table} (
+    `file_hash` char(40) NOT NULL COMMENT 'sha1 of file name',
+    `start_line` bigint unsigned NOT NULL,
+    `end_line` bigint unsigned NOT NULL,
+    `file_name` varchar(1024) NOT NULL,
+    `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (`file_hash`, `start_line`)
+) ENGINE=InnoDB COMMENT='committed line parts of execute_mysql_dml'"""
+
+
+def get_file_hash(sql_file):
+    return hashlib.sha1(str(sql_file).encode('utf8')).hexdigest()
+
+
+class ProgressStore(object):
+    """
+    将已提交的行区间保存在目标库的表中，区间与 chunk 在同一个事务中写入，
+    保证 chunk 只会被执行一次，可替代本地的 json 结果文件
+    """
+
+    def __init__(self, mysql_obj, table):
+        if not table_name_regex.match(table):
+            raise ValueError(f'Invalid progress table name: {table}')
+        self.mysql_obj = mysql_obj
+        self.table = table
+        self.table_exists = True
+
+    def create_table(self):
+        self.mysql_obj.query(CREATE_TABLE_SQL.format(table=self.table))
+        self.table_exists = True
+        return
+
+    def check_table_exists(self):
+        """只读地检查进度表是否存在（预检查不能修改目标库），不存在时还没有已提交的行"""
+        try:
+            self.mysql_obj.query(f'SELECT 1 FROM {self.table} LIMIT 1')
+            self.table_exists = True
+        except Exception as e:
+            # 1146: ER_NO_SUCH_TABLE
+            if getattr(e, 'errno', None) != 1146:
+                raise e
+            self.table_exists = False
+        return self.table_exists
+
+    def get_committed_part(self, sql_file):
+        rows = self.mysql_obj.query(
+            f'SELECT start_line, end_line FROM {self.table} WHERE file_hash = %s ORDER BY start_line',
+            (get_file_hash(sql_file),)
+        )
+        committed_part = modify_idx_record_list([f'{row["start_line"]}-{row["end_line"]}' for row in rows])
+        committed_part.sort(key=sort_start)
+        return committed_part
+
+    def get_file_executed_record(self, args, sql_file):
+        if args.reset or not self.table_exists:
+            return [], [], []
+        committed_part = self.get_committed_part(sql_file)
+        committed_part_start, committed_part_end = get_file_record_part_start_end(committed_part)
+        return committed_part, committed_part_start, committed_part_end
+
+    def record(self, cursor, sql_idx_list, sql_file):
+        """在当前事务中记录 chunk 的行区间，不提交，由调用方与 chunk 一起提交"""
+        self.insert_committed_part(cursor, sql_file, modify_idx_record_list(sorted(sql_idx_list)))
+        return
+
+    def is_committed(self, sql_idx_list, sql_file):
+        """
+        提交时连接断开无法确定事务是否已提交，chunk 的行区间与 chunk 在同一个事务中写入，
+        重连后查询进度表中是否有 chunk 的第一行即可判断
+        """
+        rows = self.mysql_obj.query(
+            f'SELECT 1 FROM {self.table} WHERE file_hash = %s AND start_line <= %s AND end_line >= %s LIMIT 1',
+            (get_file_hash(sql_file), min(sql_idx_list), min(sql_idx_list))
+        )
+        return bool(rows)
+
+    def insert_committed_part(self, cursor, sql_file, committed_part):
+        if not committed_part:
+            return
+        file_hash = get_file_hash(sql_file)
+        values = []
+        params = []
+        for part in committed_part:
+            start_line, end_line = part.split('-')
+            values.append('(%s, %s, %s, %s)')
+            params += [file_hash, int(start_line), int(end_line), str(sql_file)]
+        cursor.execute(
+            f'INSERT INTO {self.table} (file_hash, start_line, end_line, file_name) VALUES {", ".join(values)} '
+            f'ON DUPLICATE KEY UPDATE end_line = GREATEST(end_line, VALUES(end_line))',
+            tuple(params)
+        )
+        return
+
+    def save_executed_result(self, cursor, sql_file, committed_part, delete_not_exists_file_record=False,
+                             executed_all_parts=False):
+        """文件执行结束时将每个 chunk 的记录合并成连续的区间，减少表中的记录数"""
+        # 执行被中断时连接上可能还有未提交的修改，先回滚，不能和进度一起提交
+        cursor.execute('rollback')
+        cursor.execute(f'DELETE FROM {self.table} WHERE file_hash = %s', (get_file_hash(sql_file),))
+        self.insert_committed_part(cursor, sql_file, committed_part)
+        if delete_not_exists_file_record and executed_all_parts:
+            for row in self.mysql_obj.query(f'SELECT DISTINCT file_hash, file_name FROM {self.table}'):
+                if not is_stream_key(row['file_name']) and not Path(row['file_name']).exists():
+                    logger.info(f'Delete not exists file record: {row["file_name"]}')
+                    cursor.execute(f'DELETE FROM {self.table} WHERE file_hash = %s', (row['file_hash'],))
+        cursor.execute('commit')
+        return
+
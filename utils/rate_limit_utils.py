@@ -0,0 +1,87 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import os
+import time
+import fcntl
+import struct
+import asyncio
+
+BUCKET_STATE = struct.Struct('dd')  # 共享令牌桶文件内容：(令牌数, 更新时间)
+
+
+class TokenBucket(object):
+    """
+    令牌桶限速，rate 为每秒生成的令牌数，最多累积 burst 个令牌（默认 1 秒的量）。
+    令牌数允许为负（先执行后按影响行数扣减），为负时需要等待到令牌数恢复为 0
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.last_time = time.monotonic()
+
+    def reserve(self, amount=1):
+        """扣减令牌并返回需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def consume(self, amount=1):
+        wait_time = self.reserve(amount)
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    async def async_consume(self, amount=1):
+        wait_time = self.reserve(amount)
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        return wait_time
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    多进程共享的令牌桶，状态保存在 bucket_file 中并用文件锁保护。
+    为了减少加锁次数，每次从共享桶中批量借出 lease 个令牌在本地使用，用完再借
+    """
+
+    def __init__(self, rate, bucket_file, burst=None, lease=None):
+        super().__init__(rate, burst)
+        self.bucket_file = bucket_file
+        self.lease = float(lease or max(1.0, self.rate / 20))
+        self.tokens = 0
+
+    def reserve(self, amount=1):
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0
+
+        borrow = amount - self.tokens + self.lease
+        fd = os.open(self.bucket_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            data = os.pread(fd, BUCKET_STATE.size, 0)
+            if len(data) == BUCKET_STATE.size:
+                shared_tokens, last_time = BUCKET_STATE.unpack(data)
+                shared_tokens = min(self.capacity, shared_tokens + max(now - last_time, 0) * self.rate)
+            else:
+                shared_tokens = self.capacity
+            shared_tokens -= borrow
+            os.pwrite(fd, BUCKET_STATE.pack(shared_tokens, now), 0)
+        finally:
+            os.close(fd)
+
+        self.tokens += borrow - amount
+        return -shared_tokens / self.rate if shared_tokens < 0 else 0
+
+
+def get_rate_limiter(args):
+    if not args.rate_limit:
+        return None
+    if args.rate_limit_file:
+        return SharedTokenBucket(args.rate_limit, args.rate_limit_file)
+    return TokenBucket(args.rate_limit)
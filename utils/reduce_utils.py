@@ -0,0 +1,101 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+from .sql_utils import parse_dml, normalize_literal, literal_value_regex
+
+
+class StatementReducer(object):
+    """
+    消除 chunk 中对同一主键的冗余语句，只在以下严格条件下生效：
+    1. 表有主键、没有触发器、没有外键（包括被其他表引用）；
+    2. UPDATE/DELETE 的 WHERE 只包含全部主键列的等值条件，UPDATE 不修改主键列；
+    3. 全行 UPDATE（SET 了除主键外的所有可写列，且值都是常量）会覆盖之前对同一主键的 UPDATE，
+       之前的 UPDATE 被消除（后写者胜）；
+    4. INSERT 之后紧接着（同一主键之间没有其他语句）DELETE 同一主键，两者都被消除；
+    5. 能解析且表没有触发器和外键的其他语句只清空其所在表的状态，无法解析的语句（可能通过子查询、JOIN 读写其他表）
+       以及有触发器或外键的表上的语句清空所有状态。
+    被消除的行和 chunk 中其他行一起提交并记录为已提交。设置了 --skip-error-regex 时不能使用，
+    保留的语句出错被跳过后仍会记录为已提交，被它消除的语句也就丢失了
+    """
+
+    def __init__(self, table_meta):
+        self.table_meta = table_meta
+
+    def get_key_value(self, meta, column, value):
+        """整数列的 7 和 '7' 是同一个值，其他类型的列按原样（包括引号）比较"""
+        return normalize_literal(value) if column in meta['integer_columns'] else value.strip()
+
+    def get_row_key(self, statement):
+        """返回 (表, 主键值) 以及语句是否满足消除条件，不满足时返回 None"""
+        meta = self.table_meta.get(statement['table'])
+        if meta is None or not meta['pk'] or meta['has_trigger'] or meta['has_foreign_key']:
+            return None
+
+        table = self.table_meta.get_table_key(statement['table'])
+        if statement['type'] == 'INSERT':
+            if any(column not in statement['values'] for column in meta['pk']):
+                return None
+            values = [statement['values'][column] for column in meta['pk']]
+            if not all(literal_value_regex.match(value) for value in values):
+                return None
+            return table, tuple(self.get_key_value(meta, column, value) for column, value in zip(meta['pk'], values))
+
+        if sorted(statement['conditions']) != sorted(meta['pk']):
+            return None
+        if any(column in meta['pk'] for column in statement['values']):
+            return None
+        return table, tuple(self.get_key_value(meta, column, statement['conditions'][column]) for column in meta['pk'])
+
+    def is_full_row_update(self, statement):
+        meta = self.table_meta.get(statement['table'])
+        columns = set(meta['columns']) - set(meta['pk'])
+        values = statement['values']
+        return set(values) == columns and all(literal_value_regex.match(value) for value in values.values())
+
+    def reduce(self, sql_list, sql_idx_list):
+        """返回 (保留的 SQL 列表, 保留的行号列表, 被消除的行号列表)"""
+        eliminated = set()
+        updates = {}  # 行 -> 上一次非 UPDATE 语句之后的 UPDATE 位置
+        inserts = {}  # 行 -> INSERT 位置，之后还没有其他语句访问这一行
+
+        def clear_table(table=None):
+            for states in (updates, inserts):
+                for row_key in [k for k in states if table is None or k[0] == table]:
+                    del states[row_key]
+
+        for position, sql in enumerate(sql_list):
+            statement = parse_dml(sql)
+            row_key = self.get_row_key(statement) if statement is not None else None
+            if row_key is None:
+                meta = self.table_meta.get(statement['table']) if statement is not None else None
+                if meta is None or meta['has_trigger'] or meta['has_foreign_key']:
+                    clear_table()
+                else:
+                    clear_table(self.table_meta.get_table_key(statement['table']))
+                continue
+
+            if statement['type'] == 'UPDATE':
+                inserts.pop(row_key, None)
+                if self.is_full_row_update(statement):
+                    eliminated.update(updates.get(row_key, []))
+                    updates[row_key] = [position]
+                else:
+                    updates.setdefault(row_key, []).append(position)
+            elif statement['type'] == 'DELETE':
+                updates.pop(row_key, None)
+                insert_position = inserts.pop(row_key, None)
+                if insert_position is not None:
+                    eliminated.update([insert_position, position])
+            else:
+                updates.pop(row_key, None)
+                inserts[row_key] = position
+
+        reduced_sql_list = []
+        reduced_idx_list = []
+        eliminated_idx_list = []
+        for position, (sql, sql_idx) in enumerate(zip(sql_list, sql_idx_list)):
+            if position in eliminated:
+                eliminated_idx_list.append(sql_idx)
+            else:
+                reduced_sql_list.append(sql)
+                reduced_idx_list.append(sql_idx)
+        return reduced_sql_list, reduced_idx_list, eliminated_idx_list
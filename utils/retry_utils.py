@@ -0,0 +1,115 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import time
+from pathlib import Path
+from .other_utils import logger
+
+# 可重试的错误码：锁等待超时、死锁、连接数过多
+TRANSIENT_ERRNO = {
+    1040,  # ER_CON_COUNT_ERROR
+    1205,  # ER_LOCK_WAIT_TIMEOUT
+    1213,  # ER_LOCK_DEADLOCK
+}
+# 连接断开的错误码：服务端重启、主从切换、超过 wait_timeout 被断开等，重连后可以重新执行未提交的 chunk
+CONNECTION_ERRNO = {
+    2003,  # CR_CONN_HOST_ERROR
+    2006,  # CR_SERVER_GONE_ERROR
+    2013,  # CR_SERVER_LOST
+    2055,  # CR_SERVER_LOST_EXTENDED
+    4031,  # ER_CLIENT_INTERACTION_TIMEOUT
+}
+
+
+class ChunkError(Exception):
+    """chunk 执行失败，记录出错的 SQL 及其所在行，sql_idx 为 None 表示在 commit 时出错"""
+
+    def __init__(self, error, sql_idx=None, sql=''):
+        super().__init__(str(error))
+        self.error = error
+        self.errno = getattr(error, 'errno', None)
+        self.sql_idx = sql_idx
+        self.sql = sql
+
+
+def is_transient_error(error):
+    return getattr(error, 'errno', None) in TRANSIENT_ERRNO
+
+
+def is_connection_lost(mysql_obj, error):
+    """错误码是连接断开，或者出错后连接已不可用（如 "MySQL Connection not available" 没有错误码）"""
+    return getattr(error, 'errno', None) in CONNECTION_ERRNO or not mysql_obj.ping()
+
+
+def get_retry_sleep_time(retry_interval, attempt):
+    """指数退避：retry_interval * 2 ^ attempt，最多 60 秒"""
+    return min(retry_interval * 2 ** attempt, 60)
+
+
+def run_with_retry(func, args, base_format, *func_args):
+    attempt = 0
+    while True:
+        try:
+            return func(*func_args)
+        except ChunkError as e:
+            if not is_transient_error(e.error) or attempt >= args.retry_times:
+                raise e
+            sleep_time = get_retry_sleep_time(args.retry_interval, attempt)
+            attempt += 1
+            logger.warning(base_format + f'[Transient error {e.errno}, retry {attempt}/{args.retry_times} '
+                                         f'after {sleep_time}s] {e}')
+            time.sleep(sleep_time)
+
+
+def reconnect_with_retry(mysql_obj, args, base_format=''):
+    """按指数退避重连，超过 --reconnect-times 次仍然失败时抛出最后一次的异常"""
+    attempt = 0
+    while True:
+        sleep_time = get_retry_sleep_time(args.reconnect_interval, attempt)
+        attempt += 1
+        logger.warning(base_format + f'[Connection lost, reconnect {attempt}/{args.reconnect_times} '
+                                     f'after {sleep_time}s]')
+        time.sleep(sleep_time)
+        try:
+            mysql_obj.reconnect()
+        except Exception as e:
+            if attempt >= args.reconnect_times or \
+                    not (getattr(e, 'errno', None) in CONNECTION_ERRNO or is_transient_error(e)):
+                raise e
+            logger.warning(base_format + f'[Reconnect failed] {e}')
+            continue
+        logger.info(base_format + f'[Reconnected after {attempt} attempts]')
+        return
+
+
+def check_connection(mysql_obj, args, base_format=''):
+    """健康检查：长时间空闲（--stop-never 的 sleep）后连接可能已被断开，断开时重连"""
+    if args.reconnect_times and not mysql_obj.ping():
+        reconnect_with_retry(mysql_obj, args, base_format)
+    return
+
+
+def split_failed_part(sql_list, sql_idx_list, failed_sql_idx):
+    """
+    将失败的 chunk 拆分：已知出错行时拆成 [出错行之前, 出错行, 出错行之后]，
+    否则二分，返回非空的子 chunk 列表
+    """
+    if failed_sql_idx in sql_idx_list:
+        i = sql_idx_list.index(failed_sql_idx)
+        parts = [
+            (sql_list[:i], sql_idx_list[:i]),
+            (sql_list[i:i + 1], sql_idx_list[i:i + 1]),
+            (sql_list[i + 1:], sql_idx_list[i + 1:]),
+        ]
+    else:
+        mid = len(sql_list) // 2
+        parts = [(sql_list[:mid], sql_idx_list[:mid]), (sql_list[mid:], sql_idx_list[mid:])]
+    return [part for part in parts if part[0]]
+
+
+def save_rejected_line(reject_file, base_format, sql_idx, sql, error):
+    """被拒绝的 SQL 以注释 + 原 SQL 的形式追加到 reject 文件中，修复后可直接用本脚本重新执行"""
+    Path(reject_file).parent.mkdir(exist_ok=True, parents=True)
+    error_msg = str(error).replace('\n', ' ')
+    with open(reject_file, 'a', encoding='utf8') as f:
+        f.write(f'-- {base_format}[line: {sql_idx}] {error_msg}\n{sql}\n')
+    return
@@ -0,0 +1,185 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import time
+import heapq
+import itertools
+from pathlib import Path
+from .other_utils import logger
+
+MAX_GROUP_FILES = 1000
+
+
+def parse_dir_weights(dir_weight_list):
+    """['dir1=10', 'dir2=1'] -> {'/abs/dir1': 10.0, '/abs/dir2': 1.0}"""
+    dir_weights = {}
+    for dir_weight in dir_weight_list or []:
+        if '=' not in dir_weight:
+            raise ValueError(f'Invalid dir weight: {dir_weight}, format: dir=weight')
+        dir_name, weight = dir_weight.rsplit('=', 1)
+        dir_weights[str(Path(dir_name).absolute())] = float(weight)
+    return dir_weights
+
+
+class FileScheduler(object):
+    """
+    待执行文件的优先级队列，排序依据为 (轮次, 策略优先级)：
+    name: 文件名顺序；oldest: 修改时间最早优先；smallest: 文件最小优先；weight: 目录权重最大优先。
+    文件每执行 slice_chunks 个 chunk 就让出一次并进入下一轮，新加入的文件从当前轮次开始排队，
+    这样大文件执行期间到达的小文件能够在一个分片之后就被执行。
+    设置了 lease_manager 时，文件开始执行前先获取租约，租约被其他实例持有的文件从队列中移除，重新扫描时再尝试
+    """
+
+    def __init__(self, policy='name', slice_chunks=0, dir_weights=None, group_file_size=0, lease_manager=None):
+        self.policy = policy
+        self.slice_chunks = slice_chunks
+        self.group_file_size = group_file_size
+        self.dir_weights = dir_weights or {}
+        self.lease_manager = lease_manager
+        self.queue = []
+        self.jobs = {}
+        self.finished = {}
+        self.round = 0
+        self.seq = itertools.count()
+
+    def get_dir_weight(self, sql_file):
+        sql_file = str(Path(sql_file).absolute())
+        matched_dir = max((d for d in self.dir_weights if sql_file.startswith(d.rstrip('/') + '/')),
+                          key=len, default=None)
+        return self.dir_weights[matched_dir] if matched_dir else 1
+
+    def get_priority(self, job):
+        if self.policy == 'oldest':
+            return job['mtime'], str(job['sql_file'])
+        elif self.policy == 'smallest':
+            return job['size'], str(job['sql_file'])
+        elif self.policy == 'weight':
+            return -self.get_dir_weight(job['sql_file']), job['mtime'], str(job['sql_file'])
+        return str(job['sql_file']),
+
+    def push(self, job, job_round):
+        heapq.heappush(self.queue, (job_round, self.get_priority(job), next(self.seq), str(job['sql_file'])))
+        return
+
+    def add_files(self, sql_file_list):
+        """加入新文件，已在队列中或执行完成后没有变化的文件不会重复加入"""
+        for sql_file in sql_file_list:
+            key = str(sql_file)
+            if key in self.jobs:
+                continue
+            try:
+                stat = Path(sql_file).stat()
+            except FileNotFoundError:
+                continue
+            if self.finished.get(key) == (stat.st_size, stat.st_mtime):
+                continue
+
+            job = {
+                'sql_file': sql_file, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                'enqueue_time': time.time(), 'start_time': None, 'generator': None
+            }
+            self.jobs[key] = job
+            self.push(job, self.round)
+        return
+
+    def acquire(self, job):
+        return self.lease_manager is None or self.lease_manager.acquire(job['sql_file'])
+
+    def drop(self, job):
+        """移除没有获得租约或租约丢失的文件，不记录为执行完成"""
+        self.jobs.pop(str(job['sql_file']), None)
+        if self.lease_manager is not None:
+            self.lease_manager.release(job['sql_file'])
+        return
+
+    def finish(self, job):
+        key = str(job['sql_file'])
+        del self.jobs[key]
+        if self.lease_manager is not None:
+            self.lease_manager.release(job['sql_file'])
+        try:
+            stat = Path(job['sql_file']).stat()
+            self.finished[key] = (stat.st_size, stat.st_mtime)
+        except FileNotFoundError:
+            self.finished.pop(key, None)
+
+        now = time.time()
+        logger.info(f'[{job["sql_file"]}] [Queue latency: {job["start_time"] - job["enqueue_time"]:.3f}s] '
+                    f'[Total latency: {now - job["enqueue_time"]:.3f}s]')
+        return
+
+    def is_small_job(self, job):
+        return job['generator'] is None and job['size'] <= self.group_file_size
+
+    def pop_small_jobs(self, job):
+        """取出队首连续的未开始执行的小文件，与 job 组成一组"""
+        jobs = [job]
+        while self.queue and len(jobs) < MAX_GROUP_FILES and self.is_small_job(self.jobs[self.queue[0][3]]):
+            jobs.append(self.jobs[heapq.heappop(self.queue)[3]])
+        return jobs
+
+    def run(self, start_job, rescan=None, start_group=None):
+        """
+        按优先级执行队列中的文件直到队列为空，start_job(sql_file) 返回每执行一个 chunk 就 yield 一次的生成器，
+        每个分片结束后调用 rescan() 将新到达的文件加入队列。
+        设置了 group_file_size 时，连续的小文件交给 start_group(sql_file_list) 一起执行
+        """
+        while self.queue:
+            job_round, _, _, key = heapq.heappop(self.queue)
+            self.round = job_round
+            job = self.jobs[key]
+            if start_group is not None and self.group_file_size and self.is_small_job(job):
+                jobs = []
+                for small_job in self.pop_small_jobs(job):
+                    if self.acquire(small_job):
+                        jobs.append(small_job)
+                    else:
+                        self.drop(small_job)
+                for small_job in jobs:
+                    small_job['start_time'] = time.time()
+                if jobs:
+                    start_group([small_job['sql_file'] for small_job in jobs])
+                for small_job in jobs:
+                    self.finish(small_job)
+                if rescan is not None:
+                    rescan()
+                continue
+
+            if job['generator'] is None:
+                if not self.acquire(job):
+                    self.drop(job)
+                    continue
+                job['start_time'] = time.time()
+                job['generator'] = start_job(job['sql_file'])
+
+            finished = True
+            lost = False
+            for i, _ in enumerate(job['generator'], 1):
+                if self.lease_manager is not None and self.lease_manager.is_lost(key):
+                    lost = True
+                    break
+                if self.slice_chunks and i >= self.slice_chunks:
+                    finished = False
+                    break
+
+            if lost:
+                # 停止执行并保存已提交的行，由回收租约的实例继续执行
+                logger.error(f'Lease of file {key} is lost, stop executing it.')
+                job['generator'].close()
+                self.drop(job)
+            elif finished:
+                self.finish(job)
+            else:
+                self.push(job, job_round + 1)
+
+            if rescan is not None:
+                rescan()
+        return
+
+    def close(self):
+        """关闭未执行完成的文件，触发其保存已提交的行"""
+        for job in self.jobs.values():
+            if job['generator'] is not None:
+                job['generator'].close()
+        self.jobs.clear()
+        self.queue.clear()
+        return
@@ -0,0 +1,173 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import re
+
+DML_TYPES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# 字符串、十六进制、数字常量统一替换成 ?
+literal_regex = re.compile(
+    r"'(?:[^'\\]|\\.|'')*'"
+    r'|"(?:[^"\\]|\\.|"")*"'
+    r'|\b0x[0-9a-fA-F]+\b'
+    r'|(?<![\w`])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b'
+)
+value_list_regex = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+multi_value_list_regex = re.compile(r'\(\?\+\)(?:\s*,\s*\(\?\+\))+')
+in_list_regex = re.compile(r'\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)')
+space_regex = re.compile(r'\s+')
+table_regex = re.compile(
+    r'^\s*(?:insert|replace)\s+(?:(?:low_priority|delayed|high_priority|ignore)\s+)*(?:into\s+)?([`\w.]+)'
+    r'|^\s*update\s+(?:(?:low_priority|ignore)\s+)*([`\w.]+)'
+    r'|^\s*delete\s+(?:(?:low_priority|quick|ignore)\s+)*from\s+([`\w.]+)',
+    re.IGNORECASE
+)
+
+
+def get_sql_type(sql):
+    return sql.strip()[:7].strip().upper()
+
+
+def is_dml(sql):
+    return get_sql_type(sql) in DML_TYPES
+
+
+def get_table_name(sql):
+    """获取 DML 语句操作的表名（去掉反引号），无法识别时返回空字符串"""
+    match = table_regex.match(sql)
+    if match is None:
+        return ''
+    return next(group for group in match.groups() if group).replace('`', '')
+
+
+def get_sql_fingerprint(sql):
+    """
+    将 SQL 归一化成指纹：常量替换为 ?，IN 列表和 VALUES 多行合并，空白折叠，统一小写，如：
+    INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y') -> insert into t (a, b) values (?+)
+    """
+    fingerprint = literal_regex.sub('?', sql.strip().rstrip(';'))
+    fingerprint = space_regex.sub(' ', fingerprint).lower()
+    fingerprint = in_list_regex.sub('in (?+)', fingerprint)
+    fingerprint = value_list_regex.sub('(?+)', fingerprint)
+    fingerprint = multi_value_list_regex.sub('(?+)', fingerprint)
+    return fingerprint
+
+
+quote_regex = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+literal_value_regex = re.compile(
+    r"^(?:'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|-?\d+(?:\.\d+)?|0x[0-9a-fA-F]+|null)$", re.IGNORECASE
+)
+integer_value_regex = re.compile(r"^['\"]?(-?\d+)['\"]?$")
+assignment_regex = re.compile(r'^\s*`?(\w+)`?\s*=\s*(.*?)\s*$', re.DOTALL)
+update_regex = re.compile(
+    r'^\s*update\s+([`\w.]+)\s+set\s+(.+?)\s+where\s+(.+?)(?:\s+limit\s+1)?\s*;?\s*$', re.IGNORECASE | re.DOTALL
+)
+delete_regex = re.compile(
+    r'^\s*delete\s+from\s+([`\w.]+)\s+where\s+(.+?)(?:\s+limit\s+1)?\s*;?\s*$', re.IGNORECASE | re.DOTALL
+)
+insert_regex = re.compile(
+    r'^\s*insert\s+into\s+([`\w.]+)\s*\((.+?)\)\s*values?\s*(\(.+\))\s*;?\s*$', re.IGNORECASE | re.DOTALL
+)
+and_regex = re.compile(r'\s+and\s+', re.IGNORECASE)
+unsupported_regex = re.compile(r'\b(?:select|on\s+duplicate|join)\b|[@]', re.IGNORECASE)
+
+
+def mask_quoted(sql):
+    """将引号内的内容替换成等长的占位符，便于在不受字符串内容影响的情况下匹配关键字和分隔符"""
+    return quote_regex.sub(lambda m: m.group()[0] + '_' * (len(m.group()) - 2) + m.group()[-1], sql)
+
+
+def split_top_level(sql, masked, separator_regex=None):
+    """在引号和括号之外按分隔符（默认为逗号）切分，masked 为 mask_quoted(sql) 的结果"""
+    parts = []
+    depth = 0
+    start = 0
+    if separator_regex is not None:
+        positions = [(m.start(), m.end()) for m in separator_regex.finditer(masked)]
+    else:
+        positions = [(i, i + 1) for i, c in enumerate(masked) if c == ',']
+
+    paren_depth = []
+    for c in masked:
+        depth += c == '('
+        depth -= c == ')'
+        paren_depth.append(depth)
+
+    for position_start, position_end in positions:
+        if paren_depth[position_start] == 0:
+            parts.append(sql[start:position_start])
+            start = position_end
+    parts.append(sql[start:])
+    return parts
+
+
+def normalize_literal(value):
+    """整数（包括引号中的整数）统一成不带引号的形式，其他常量保持原样，只能用于整数类型的列（字符串列中 '007' 和 '7' 是不同的值）"""
+    value = value.strip()
+    match = integer_value_regex.match(value)
+    if match is not None:
+        return str(int(match.group(1)))
+    return value
+
+
+def parse_assignments(sql, masked):
+    """解析 a = 1, b = 'x' 形式的赋值，返回 {列名小写: 值}，无法解析时返回 None"""
+    assignments = {}
+    for part in split_top_level(sql, masked):
+        match = assignment_regex.match(part)
+        if match is None:
+            return None
+        assignments[match.group(1).lower()] = match.group(2)
+    return assignments
+
+
+def parse_conditions(sql, masked):
+    """解析 a = 1 AND b = 'x' 形式的等值条件，返回 {列名小写: 常量}，包含其他条件时返回 None"""
+    conditions = {}
+    for part in split_top_level(sql, masked, and_regex):
+        match = assignment_regex.match(part)
+        if match is None or not literal_value_regex.match(match.group(2)) or match.group(2).lower() == 'null':
+            return None
+        conditions[match.group(1).lower()] = match.group(2).strip()
+    return conditions
+
+
+def parse_dml(sql):
+    """
+    解析单行的简单 DML，返回 {'type', 'table', 'values': {列: 值}, 'conditions': {列: 常量}}，
+    只支持：UPDATE t SET ... WHERE 等值条件；DELETE FROM t WHERE 等值条件；INSERT INTO t (列) VALUES (单行)，
+    其他语句（多行 INSERT、IGNORE、子查询、JOIN、ORDER BY 等）返回 None
+    """
+    masked = mask_quoted(sql)
+    if unsupported_regex.search(masked):
+        return None
+
+    match = update_regex.match(masked)
+    if match is not None:
+        set_sql, where_sql = sql[match.start(2):match.end(2)], sql[match.start(3):match.end(3)]
+        values = parse_assignments(set_sql, match.group(2))
+        conditions = parse_conditions(where_sql, match.group(3))
+        if values is None or conditions is None:
+            return None
+        return {'type': 'UPDATE', 'table': match.group(1).replace('`', ''), 'values': values,
+                'conditions': conditions}
+
+    match = delete_regex.match(masked)
+    if match is not None:
+        conditions = parse_conditions(sql[match.start(2):match.end(2)], match.group(2))
+        if conditions is None:
+            return None
+        return {'type': 'DELETE', 'table': match.group(1).replace('`', ''), 'values': {}, 'conditions': conditions}
+
+    match = insert_regex.match(masked)
+    if match is not None:
+        columns = [column.strip().strip('`').lower() for column in match.group(2).split(',')]
+        values_sql, values_masked = sql[match.start(3):match.end(3)], match.group(3)
+        rows = split_top_level(values_sql, values_masked)
+        if len(rows) != 1 or not values_masked.endswith(')'):
+            return None
+        values = split_top_level(values_sql[1:-1], values_masked[1:-1])
+        if len(values) != len(columns):
+            return None
+        return {'type': 'INSERT', 'table': match.group(1).replace('`', ''),
+                'values': dict(zip(columns, (value.strip() for value in values))), 'conditions': {}}
+    return None
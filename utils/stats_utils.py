@@ -0,0 +1,118 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import math
+from .other_utils import logger
+from .sql_utils import get_sql_fingerprint
+
+# 耗时直方图：从 10 微秒开始，每个桶比上一个大 10%，共覆盖到约 10 分钟
+BUCKET_BASE = 0.00001
+BUCKET_FACTOR = 1.1
+BUCKET_COUNT = int(math.log(60000000) / math.log(BUCKET_FACTOR)) + 1
+LOG_BUCKET_FACTOR = math.log(BUCKET_FACTOR)
+
+
+def get_bucket_index(used_time):
+    if used_time <= BUCKET_BASE:
+        return 0
+    return min(int(math.log(used_time / BUCKET_BASE) / LOG_BUCKET_FACTOR) + 1, BUCKET_COUNT - 1)
+
+
+def new_stat():
+    return {'count': 0, 'total_time': 0, 'max_time': 0, 'rows': 0, 'buckets': [0] * BUCKET_COUNT}
+
+
+def merge_stats(stats, other_stats):
+    """将 other_stats 合并到 stats 中"""
+    for fingerprint, other in other_stats.items():
+        stat = stats.get(fingerprint)
+        if stat is None:
+            stat = stats[fingerprint] = new_stat()
+        stat['count'] += other['count']
+        stat['total_time'] += other['total_time']
+        stat['rows'] += other['rows']
+        stat['max_time'] = max(stat['max_time'], other['max_time'])
+        stat['buckets'] = [a + b for a, b in zip(stat['buckets'], other['buckets'])]
+    return stats
+
+
+class FingerprintStats(object):
+    """
+    按 SQL 指纹聚合执行次数、耗时和影响行数，p99 由对数直方图估算，内存占用与 SQL 数量无关。
+    调度器会交替执行多个文件，统计按文件分开记录，文件结束时输出该文件的统计并合并到累计统计中。
+    SIGUSR1 的处理函数只设置标记，由执行循环在 chunk 之间输出累计统计（在信号处理函数中调用 loguru 可能死锁）
+    """
+
+    def __init__(self):
+        self.stats = {}  # 已结束的文件的累计统计
+        self.file_stats = {}  # 执行中的文件: {指纹: 统计}
+        self.report_requested = False
+
+    def record(self, sql, used_time, affected_rows, sql_file=''):
+        fingerprint = get_sql_fingerprint(sql)
+        stats = self.file_stats.get(sql_file)
+        if stats is None:
+            stats = self.file_stats[sql_file] = {}
+        stat = stats.get(fingerprint)
+        if stat is None:
+            stat = stats[fingerprint] = new_stat()
+        stat['count'] += 1
+        stat['total_time'] += used_time
+        stat['rows'] += max(affected_rows, 0)
+        if used_time > stat['max_time']:
+            stat['max_time'] = used_time
+        stat['buckets'][get_bucket_index(used_time)] += 1
+        return
+
+    @staticmethod
+    def get_percentile(stat, percent):
+        threshold = stat['count'] * percent
+        total = 0
+        for i, count in enumerate(stat['buckets']):
+            total += count
+            if total >= threshold:
+                return min(BUCKET_BASE * BUCKET_FACTOR ** i, stat['max_time'])
+        return stat['max_time']
+
+    def finish_file(self, sql_file):
+        """文件执行结束，返回该文件的统计并合并到累计统计中"""
+        stats = self.file_stats.pop(sql_file, {})
+        merge_stats(self.stats, stats)
+        return stats
+
+    def get_total_stats(self):
+        stats = merge_stats({}, self.stats)
+        for file_stats in self.file_stats.values():
+            merge_stats(stats, file_stats)
+        return stats
+
+    def request_report(self):
+        """在信号处理函数中调用，只设置标记"""
+        self.report_requested = True
+        return
+
+    def report_if_requested(self, top=10):
+        if self.report_requested:
+            self.report_requested = False
+            self.report(top, '[Total] ')
+        return
+
+    def report(self, top=10, title='', stats=None):
+        """按总耗时倒序输出前 top 个指纹的统计，stats 为 None 时输出所有文件的累计统计"""
+        if stats is None:
+            stats = self.get_total_stats()
+        if not stats:
+            return
+        total_time = sum(stat['total_time'] for stat in stats.values()) or 1
+        logger.info(f'[Statement stats] {title}[Fingerprints: {len(stats)}] Top {top} by total time:')
+        for fingerprint, stat in sorted(stats.items(), key=lambda x: x[1]['total_time'], reverse=True)[:top]:
+            logger.info(
+                f'[Statement stats] [Count: {stat["count"]}] '
+                f'[Total: {stat["total_time"]:.3f}s ({stat["total_time"] / total_time:.1%})] '
+                f'[Avg: {stat["total_time"] / stat["count"] * 1000:.3f}ms] '
+                f'[P99: {self.get_percentile(stat, 0.99) * 1000:.3f}ms] '
+                f'[Max: {stat["max_time"] * 1000:.3f}ms] [Rows: {stat["rows"]}] {fingerprint}'
+            )
+        return
+
+
+statement_stats = FingerprintStats()
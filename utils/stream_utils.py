@@ -0,0 +1,84 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+import sys
+import queue
+import threading
+from .file_utils import check_line_whether_executable, STREAM_PREFIX, STDIN_KEY
+
+STREAM_EOF = object()
+STREAM_TIMEOUT = object()
+
+
+class StreamReader(object):
+    """
+    在线程中逐行读取标准输入或命名管道放入有界队列，队列满时读线程不再读取，
+    管道缓冲区写满后上游的写入随之阻塞（背压），内存占用不超过 buffer_lines 行
+    """
+
+    def __init__(self, stream_key, buffer_lines=10000):
+        self.stream_key = stream_key
+        self.queue = queue.Queue(buffer_lines)
+        self.thread = threading.Thread(target=self.read, name='stream-reader', daemon=True)
+        self.thread.start()
+
+    def open(self):
+        if self.stream_key == STDIN_KEY:
+            return open(sys.stdin.fileno(), encoding='utf8', closefd=False)
+        # 没有写入方时 open 会阻塞直到上游打开管道
+        return open(self.stream_key[len(STREAM_PREFIX):], encoding='utf8')
+
+    def read(self):
+        try:
+            with self.open() as f:
+                for line in f:
+                    self.queue.put(line)
+        finally:
+            self.queue.put(STREAM_EOF)
+        return
+
+    def get(self, timeout=None):
+        """返回下一行，超时返回 STREAM_TIMEOUT，读完返回 STREAM_EOF"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return STREAM_TIMEOUT
+
+
+def stream_handle(stream_key, base_format, ignore_part_start, ignore_part_end, args, line_summary=None):
+    """
+    与 file_handle 输出格式相同，行号为流中的序号（从 1 开始）。
+    满 chunk 条或 --stream-flush-timeout 秒内没有新行时输出已读取的 SQL，
+    被跳过的序号随每个 chunk 一起输出（sql_list 为空），这样已提交的序号始终是连续的区间。
+    已提交的序号（上游重放时）直接跳过，从上次提交的位置继续执行
+    """
+    reader = StreamReader(stream_key, args.stream_buffer)
+    sql_list = []
+    sql_idx_list = []
+    ignore_line_idx_list = []
+    seq = 0
+
+    while True:
+        line = reader.get(args.stream_flush_timeout if sql_list or ignore_line_idx_list else None)
+        if line is STREAM_EOF:
+            break
+        if line is not STREAM_TIMEOUT:
+            seq += 1
+            line = line.strip()
+            if check_line_whether_executable(line, seq, base_format, ignore_part_start, ignore_part_end,
+                                             ignore_line_idx_list, line_summary):
+                sql_list.append(line)
+                sql_idx_list.append(seq)
+            if len(sql_list) < args.chunk and len(ignore_line_idx_list) < args.chunk:
+                continue
+
+        if sql_list:
+            yield sql_list, sql_idx_list
+            sql_list = []
+            sql_idx_list = []
+        if ignore_line_idx_list:
+            yield [], ignore_line_idx_list
+            ignore_line_idx_list = []
+
+    if sql_list:
+        yield sql_list, sql_idx_list
+    yield [], ignore_line_idx_list
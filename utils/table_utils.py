@@ -0,0 +1,78 @@
+# !/usr/bin/env python3
+# -*- coding:utf8 -*-
+from .other_utils import logger
+
+INTEGER_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint'}
+GENERATED_EXTRAS = ('VIRTUAL GENERATED', 'STORED GENERATED')
+
+
+class TableMetaCache(object):
+    """缓存表的主键、可写列以及是否有触发器或外键，每张表只查询一次 information_schema"""
+
+    def __init__(self, mysql_obj, database):
+        self.mysql_obj = mysql_obj
+        self.database = database
+        self.tables = {}
+
+    def split_table_name(self, table):
+        table = table.replace('`', '')
+        if '.' in table:
+            schema, table = table.split('.', 1)
+            return schema, table
+        return self.database, table
+
+    def get_table_key(self, table):
+        return '.'.join(self.split_table_name(table)).lower()
+
+    def get(self, table):
+        """
+        返回 {'pk': [...], 'columns': [...], 'integer_columns': [...], 'has_trigger': bool, 'has_foreign_key': bool}，
+        表不存在时返回 None
+        """
+        schema, table_name = self.split_table_name(table)
+        key = self.get_table_key(table)
+        if key not in self.tables:
+            try:
+                self.tables[key] = self.query_table_meta(schema, table_name)
+            except Exception as e:
+                logger.warning(f'Get meta data of table {key} failed: {e}')
+                self.tables[key] = None
+        return self.tables[key]
+
+    def query_table_meta(self, schema, table_name):
+        rows = self.mysql_obj.query(
+            'SELECT COLUMN_NAME, COLUMN_KEY, EXTRA, DATA_TYPE FROM information_schema.COLUMNS '
+            'WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION',
+            (schema, table_name)
+        )
+        if not rows:
+            return None
+        # 虚拟列和存储生成列不能写入，不计入可写列（8.0 中有表达式默认值的列 EXTRA 为 DEFAULT_GENERATED，是可写的）
+        columns = [row['COLUMN_NAME'].lower() for row in rows
+                   if not any(extra in str(row['EXTRA']).upper() for extra in GENERATED_EXTRAS)]
+        pk = [row['COLUMN_NAME'].lower() for row in rows if row['COLUMN_KEY'] == 'PRI']
+        integer_columns = [row['COLUMN_NAME'].lower() for row in rows if str(row['DATA_TYPE']).lower() in INTEGER_TYPES]
+        if pk:
+            # 联合主键按主键中的顺序排列
+            pk_rows = self.mysql_obj.query(
+                'SELECT COLUMN_NAME FROM information_schema.STATISTICS '
+                'WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME = %s ORDER BY SEQ_IN_INDEX',
+                (schema, table_name, 'PRIMARY')
+            )
+            pk = [row['COLUMN_NAME'].lower() for row in pk_rows] or pk
+
+        trigger_rows = self.mysql_obj.query(
+            'SELECT COUNT(*) AS cnt FROM information_schema.TRIGGERS '
+            'WHERE EVENT_OBJECT_SCHEMA = %s AND EVENT_OBJECT_TABLE = %s',
+            (schema, table_name)
+        )
+        foreign_key_rows = self.mysql_obj.query(
+            'SELECT COUNT(*) AS cnt FROM information_schema.KEY_COLUMN_USAGE '
+            'WHERE REFERENCED_TABLE_NAME IS NOT NULL AND ((TABLE_SCHEMA = %s AND TABLE_NAME = %s) '
+            'OR (REFERENCED_TABLE_SCHEMA = %s AND REFERENCED_TABLE_NAME = %s))',
+            (schema, table_name, schema, table_name)
+        )
+        return {
+            'pk': pk, 'columns': columns, 'integer_columns': integer_columns,
+            'has_trigger': trigger_rows[0]['cnt'] > 0, 'has_foreign_key': foreign_key_rows[0]['cnt'] > 0
+        }